@@ -0,0 +1,300 @@
+import os
+import json
+import uuid
+import time
+import asyncio
+import threading
+import itertools
+from collections import OrderedDict
+from datetime import datetime
+
+# --- ALERT DISPATCHER ---
+# Family alerts are queued and written to Firestore off the conversation turn.
+#   * CRISIS alerts jump the queue and are flushed without waiting to batch.
+#   * Repeats of the same (user ID, type, text) within the window are coalesced
+#     into one alert document carrying a "count". A repeat moves "timestamp"
+#     (the dashboard's sort key) to the latest occurrence; "first_seen" keeps
+#     the original time.
+#   * CRISIS alerts are never coalesced: every one is a new document, so the
+#     dashboard always sounds its alarm and shows it on top.
+#   * Writes are committed in Firestore batches.
+#   * If Firestore is unavailable, writes go to an append-only JSONL spool on
+#     local disk and are replayed in the background until they succeed.
+#   * No lock is held across a Firestore commit, so a hung commit never stalls
+#     the next alert. Every write carries a version; spooled writes are folded
+#     into one write per document, and the newest version known to have
+#     landed is laid on top, so an older count can never overwrite a newer one.
+
+PRIORITY = {"CRISIS": 0}
+DEFAULT_PRIORITY = 1
+NEVER_COALESCE = {"CRISIS"}
+
+
+LANDED_MEMORY = 1000  # documents whose newest committed version is remembered
+
+
+class _Alert:
+    def __init__(self, doc_id, fields, now):
+        self.doc_id = doc_id
+        self.fields = fields
+        self.count = 1
+        self.last_seen = now
+        self.created = False  # True once the full document has been written (or spooled)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot spool {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+class AlertDispatcher:
+    def __init__(self, db, run_db, collection="alerts", window=120.0, batch_size=50,
+                 linger=0.25, spool_path="alerts_spool.jsonl", retry_interval=30.0):
+        """
+        run_db: async callable that runs a blocking function off the loop (the DB stage).
+        """
+        self.db = db
+        self.run_db = run_db
+        self.collection = collection
+        self.window = window
+        self.batch_size = batch_size
+        self.linger = linger
+        self.spool_path = spool_path
+        self.retry_interval = retry_interval
+        self._queue = asyncio.PriorityQueue()
+        self._urgent = asyncio.Event()
+        self._recent = {}
+        self._seq = itertools.count()
+        self._versions = itertools.count(1)
+        self._spool_lock = threading.Lock()  # guards the spool file only, never held across a commit
+        self._spool_base = 0  # spool lines already removed, so concurrent snapshots trim correctly
+        self._landed = OrderedDict()  # doc_id -> (version, fields) of the newest committed write
+        self._landed_lock = threading.Lock()
+        self._tasks = []
+
+    @staticmethod
+    def _key(user_id, alert_type, message):
+        # Keyed by user ID, not name: two elders called "Arthur" (or two still
+        # onboarding, with no name yet) must never merge into one alert
+        return (user_id, alert_type, " ".join(str(message).lower().split()))
+
+    def submit(self, user_id, user_name, alert_type, message):
+        """
+        Queues an alert without blocking. Returns the alert document id.
+        """
+        now = time.monotonic()
+        key = self._key(user_id, alert_type, message)
+        alert = None if alert_type in NEVER_COALESCE else self._recent.get(key)
+        if alert is not None and now - alert.last_seen <= self.window:
+            alert.count += 1
+            alert.last_seen = now
+        else:
+            created_at = datetime.now()
+            alert = _Alert(uuid.uuid4().hex, {
+                "user_id": user_id,
+                "user_name": user_name,
+                "type": alert_type,
+                "message": message,
+                "timestamp": created_at,
+                "first_seen": created_at,
+                "status": "active",
+                "count": 1,
+            }, now)
+            if alert_type not in NEVER_COALESCE:
+                self._recent[key] = alert
+            self._forget_expired(now)
+        priority = PRIORITY.get(alert_type, DEFAULT_PRIORITY)
+        self._queue.put_nowait((priority, next(self._seq), alert))
+        if priority == 0:
+            self._urgent.set()
+        return alert.doc_id
+
+    def _forget_expired(self, now):
+        expired = [k for k, a in self._recent.items() if now - a.last_seen > self.window]
+        for k in expired:
+            del self._recent[k]
+
+    async def start(self):
+        self._tasks = [
+            asyncio.create_task(self._run()),
+            asyncio.create_task(self._replay_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # Whatever is still queued goes out (or to the spool) before exit
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait()[2])
+        if pending:
+            await self._flush(pending)
+
+    async def _run(self):
+        while True:
+            priority, _, alert = await self._queue.get()
+            batch = [alert]
+            if priority > 0 and self.linger:
+                # Let a burst of repeats coalesce, unless a CRISIS alert arrives meanwhile
+                try:
+                    await asyncio.wait_for(self._urgent.wait(), self.linger)
+                except asyncio.TimeoutError:
+                    pass
+            self._urgent.clear()
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait()[2])
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        # One write per alert: the latest count wins, however many repeats were queued
+        alerts = list({id(a): a for a in batch}.values())
+        writes = []
+        for alert in alerts:
+            if alert.created:
+                seen = datetime.now()
+                fields = {"count": alert.count, "last_seen": seen, "timestamp": seen}
+            else:
+                fields = {**alert.fields, "count": alert.count}
+                alert.created = True
+            writes.append((alert.doc_id, fields, next(self._versions)))
+        try:
+            await self.run_db(self._commit_or_spool, writes)
+        except Exception as e:
+            # DB stage timeout: the commit may still land, so spool (idempotent merge).
+            # The hung commit holds no lock, so this append never waits for it.
+            print(f"❌ Alert write timed out, spooling: {e}")
+            await asyncio.to_thread(self._spool, writes)
+
+    def _commit(self, writes):
+        # Firestore batches are capped at 500 writes
+        for start in range(0, len(writes), 500):
+            batch = self.db.batch()
+            for doc_id, fields, _ in writes[start:start + 500]:
+                batch.set(self.db.collection(self.collection).document(doc_id), fields, merge=True)
+            batch.commit()
+
+    def _fold(self, writes):
+        # One write per document: fields merged oldest to newest, then the newest
+        # committed state on top if it is newer still
+        folded = {}
+        for doc_id, fields, version in sorted(writes, key=lambda w: w[2]):
+            current = folded.get(doc_id)
+            folded[doc_id] = ({**current[0], **fields} if current else dict(fields), version)
+        with self._landed_lock:
+            for doc_id, (fields, version) in folded.items():
+                landed = self._landed.get(doc_id)
+                if landed is not None and landed[0] > version:
+                    folded[doc_id] = ({**fields, **landed[1]}, landed[0])
+        return [(doc_id, fields, version) for doc_id, (fields, version) in folded.items()]
+
+    def _record_landed(self, writes):
+        """
+        Remembers committed versions. Returns the newer writes this commit
+        overwrote (a slow commit landing late); they must be written again.
+        """
+        overwritten = []
+        with self._landed_lock:
+            for doc_id, fields, version in writes:
+                landed = self._landed.get(doc_id)
+                if landed is not None and landed[0] > version:
+                    overwritten.append((doc_id, landed[1], landed[0]))
+                    continue
+                self._landed[doc_id] = (version, fields)
+                self._landed.move_to_end(doc_id)
+            while len(self._landed) > LANDED_MEMORY:
+                self._landed.popitem(last=False)
+        return overwritten
+
+    def _commit_or_spool(self, writes):
+        spooled, spool_end = self._read_spool()
+        pending = self._fold(spooled + writes)
+        try:
+            self._commit(pending)
+        except Exception as e:
+            print(f"❌ Failed to send alert, spooling {len(writes)} write(s): {e}")
+            self._spool(writes)
+            return
+        self._trim_spool(spool_end)
+        overwritten = self._record_landed(pending)
+        for doc_id, fields, _ in writes:
+            print(f"🚨 ALERT SENT TO FAMILY: [{fields.get('type', 'update')}] {fields.get('message', doc_id)} (x{fields['count']})")
+        if overwritten:
+            self._commit_or_spool(overwritten)
+
+    def _spool(self, writes):
+        with self._spool_lock:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for doc_id, fields, version in writes:
+                    f.write(json.dumps({"id": doc_id, "fields": fields, "version": version}, default=_encode) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read_spool(self):
+        # Snapshot of the spool: (writes, line number just past the last one read)
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return [], self._spool_base
+            with open(self.spool_path, encoding="utf-8") as f:
+                lines = [line for line in f if line.strip()]
+            end = self._spool_base + len(lines)
+        writes = []
+        for line in lines:
+            try:
+                entry = json.loads(line, object_hook=_decode)
+                writes.append((entry["id"], entry["fields"], entry.get("version", 0)))
+            except (ValueError, KeyError):
+                print(f"⚠️ Skipping corrupt spool line: {line[:80]}")
+        return writes, end
+
+    def _trim_spool(self, end):
+        # Drops spool lines up to end; lines appended since the snapshot stay
+        with self._spool_lock:
+            count = end - self._spool_base
+            if count <= 0 or not os.path.exists(self.spool_path):
+                return
+            with open(self.spool_path, encoding="utf-8") as f:
+                remaining = [line for line in f if line.strip()][count:]
+            if remaining:
+                tmp_path = f"{self.spool_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.writelines(remaining)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.spool_path)
+            else:
+                os.remove(self.spool_path)
+            self._spool_base = end
+
+    def replay_spool(self):
+        """
+        Commits spooled writes. Blocking; run on the DB stage.
+        """
+        spooled, spool_end = self._read_spool()
+        if not spooled:
+            self._trim_spool(spool_end)  # only corrupt lines
+            return 0
+        pending = self._fold(spooled)
+        self._commit(pending)
+        self._trim_spool(spool_end)
+        overwritten = self._record_landed(pending)
+        if overwritten:
+            self._commit_or_spool(overwritten)
+        return len(spooled)
+
+    async def _replay_loop(self):
+        while True:
+            try:
+                replayed = await self.run_db(self.replay_spool)
+                if replayed:
+                    print(f"📤 Replayed {replayed} spooled alert write(s)")
+            except Exception as e:
+                print(f"⚠️ Alert spool replay failed, will retry: {e}")
+            await asyncio.sleep(self.retry_interval)
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import speech_recognition as sr
+from pydub.utils import get_encoder_name
+
+# --- AUDIO INGEST ---
+# Decodes the phone's base64 m4a straight to 16 kHz mono PCM in memory.
+# ffmpeg resamples once, and the PCM is handed to the recognizer as
+# sr.AudioData, so a turn never touches disk and concurrent clients never
+# share a temp file.
+
+SAMPLE_RATE = 16000  # Plenty for speech; smaller upload to the recognizer
+SAMPLE_WIDTH = 2     # 16-bit signed little-endian
+
+FFMPEG = get_encoder_name()
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+def _ffmpeg_command(source):
+    return [
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-i", source,
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+
+
+def decode_to_pcm(audio_bytes):
+    """
+    Returns raw PCM for an encoded clip (m4a, wav, mp3... whatever ffmpeg reads).
+    """
+    if hasattr(os, "memfd_create"):
+        # Phone recorders put the m4a 'moov' index at the END of the file, which
+        # ffmpeg cannot demux from a pipe. An anonymous in-memory file is
+        # seekable and still never hits the disk.
+        fd = os.memfd_create("elderkeep-audio")
+        try:
+            os.write(fd, audio_bytes)
+            result = subprocess.run(
+                _ffmpeg_command(f"/dev/fd/{fd}"),
+                capture_output=True,
+                pass_fds=(fd,),
+            )
+        finally:
+            os.close(fd)
+    else:
+        # macOS/Windows dev machines: stream through stdin (fine for short clips)
+        result = subprocess.run(
+            _ffmpeg_command("pipe:0"),
+            input=audio_bytes,
+            capture_output=True,
+        )
+
+    if result.returncode != 0 or not result.stdout:
+        raise AudioDecodeError(result.stderr.decode(errors="replace").strip() or "empty audio")
+    return result.stdout
+
+
+def decode_audio(audio_bytes):
+    """
+    Encoded clip -> sr.AudioData ready for recognize_google.
+    """
+    return sr.AudioData(decode_to_pcm(audio_bytes), SAMPLE_RATE, SAMPLE_WIDTH)
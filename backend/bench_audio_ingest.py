@@ -0,0 +1,75 @@
+"""
+Micro-benchmark: file-based m4a -> wav ingest vs the in-memory ingest.
+
+    python bench_audio_ingest.py [clip.m4a] [--runs 20]
+
+Both paths stop at sr.AudioData (no network recognition), so the numbers
+are pure decode cost. Peak memory is the Python-side peak from tracemalloc.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import speech_recognition as sr
+from pydub import AudioSegment
+
+from audio_ingest import decode_audio
+
+
+def file_based(audio_bytes, workdir):
+    # The original path: m4a to disk, pydub -> wav on disk, re-read for sr
+    m4a_path = os.path.join(workdir, "temp_input.m4a")
+    wav_path = os.path.join(workdir, "temp_input.wav")
+    with open(m4a_path, "wb") as f: f.write(audio_bytes)
+    sound = AudioSegment.from_file(m4a_path, format="m4a")
+    sound.export(wav_path, format="wav")
+    with sr.AudioFile(wav_path) as source:
+        return sr.Recognizer().record(source)
+
+
+def in_memory(audio_bytes, workdir):
+    return decode_audio(audio_bytes)
+
+
+def measure(fn, audio_bytes, runs, workdir):
+    fn(audio_bytes, workdir)  # warm-up (ffmpeg binary in page cache)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(audio_bytes, workdir)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    audio = fn(audio_bytes, workdir)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, peak, audio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("clip", nargs="?", default=os.path.join(os.path.dirname(__file__), "temp_input.m4a"))
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.clip, "rb") as f:
+        audio_bytes = f.read()
+    print(f"Clip: {args.clip} ({len(audio_bytes) / 1024:.1f} KiB), {args.runs} runs\n")
+    print(f"{'path':<12}{'p50 ms':>10}{'p95 ms':>10}{'peak KiB':>12}{'pcm KiB':>10}{'rate':>8}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, fn in (("file-based", file_based), ("in-memory", in_memory)):
+            timings, peak, audio = measure(fn, audio_bytes, args.runs, workdir)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(
+                f"{name:<12}{statistics.median(timings):>10.1f}{p95:>10.1f}"
+                f"{peak / 1024:>12.1f}{len(audio.frame_data) / 1024:>10.1f}{audio.sample_rate:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
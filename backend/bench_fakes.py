@@ -0,0 +1,371 @@
+"""
+Local stand-ins for the cloud services main.py talks to, for offline load tests.
+
+    import bench_fakes
+    bench_fakes.install(bench_fakes.behaviours(latency=["gemini=0.6:0.3"], fail=["tts=0.05"]))
+    import main   # now talks to the stand-ins
+
+Each service has a Behaviour: a log-normal latency (median seconds, sigma)
+and a failure rate. Blocking clients (Firestore, the recognizer) sleep on
+the calling thread like the real ones; async clients (Gemini, ElevenLabs)
+await. install() must run before main is imported.
+"""
+import math
+import time
+import random
+import asyncio
+import threading
+
+import firebase_admin
+import speech_recognition as sr
+
+DEFAULT_BEHAVIOURS = {
+    "firestore": (0.03, 0.3, 0.0),     # one document read/write or batch commit
+    "asr": (0.6, 0.3, 0.0),            # recognize_google round trip
+    "gemini": (0.35, 0.3, 0.0),        # time to first token (or to a whole response)
+    "gemini_chunk": (0.03, 0.3, 0.0),  # between streamed chunks
+    "tts": (0.25, 0.3, 0.0),           # time to first audio chunk
+    "tts_chunk": (0.02, 0.3, 0.0),     # between audio chunks
+}
+
+TRANSCRIPTS = [
+    "good morning how are you today",
+    "i had porridge for breakfast",
+    "tell me about the weather",
+    "my daughter sarah is visiting on sunday",
+    "i was thinking about the garden",
+    "what day is it today",
+    "can you remind me about my tablets",
+    "i watched a film about the war",
+]
+
+_OPENERS = ["That sounds lovely", "How nice", "I am glad you told me", "Oh, wonderful", "I see"]
+_SUBJECTS = ["your garden", "Sarah", "the weather", "your breakfast", "the film", "your tablets", "Sunday"]
+_FOLLOW_UPS = ["Shall we talk about it more?", "What else is on your mind?", "I am right here with you.",
+               "Would you like some music?", "Tell me more when you are ready."]
+
+MP3_BYTES_PER_CHAR = 270  # mp3_22050_32 is 4 KB/s; speech runs at about 15 characters a second
+TTS_CHUNK_BYTES = 4096
+
+
+class StandInError(Exception):
+    pass
+
+
+class Behaviour:
+    def __init__(self, median, sigma=0.3, failure_rate=0.0):
+        self.median = median
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+
+    def delay(self):
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(self.sigma * random.gauss(0.0, 1.0))
+
+    def _maybe_fail(self, what):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise StandInError(f"{what}: injected failure")
+
+    def block(self, what):
+        time.sleep(self.delay())
+        self._maybe_fail(what)
+
+    async def wait(self, what):
+        await asyncio.sleep(self.delay())
+        self._maybe_fail(what)
+
+    def __repr__(self):
+        return f"{self.median * 1000:.0f}ms (sigma {self.sigma}, fail {self.failure_rate:.0%})"
+
+
+def behaviours(latency=(), fail=()):
+    """
+    Builds the behaviour table from "service=median[:sigma]" and "service=rate" overrides.
+    """
+    table = {name: list(values) for name, values in DEFAULT_BEHAVIOURS.items()}
+    for spec in latency:
+        name, _, value = spec.partition("=")
+        median, _, sigma = value.partition(":")
+        table[name][0] = float(median)
+        if sigma:
+            table[name][1] = float(sigma)
+    for spec in fail:
+        name, _, rate = spec.partition("=")
+        table[name][2] = float(rate)
+    return {name: Behaviour(*values) for name, values in table.items()}
+
+
+# --- FIRESTORE ---
+
+class _Snapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _Watch:
+    def __init__(self, store, path, callback):
+        self.store, self.path, self.callback = store, path, callback
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        self.store._unwatch(self.path, self)
+
+
+class _Document:
+    def __init__(self, store, collection, doc_id):
+        self.store = store
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def get(self):
+        self.store.behaviour.block("firestore get")
+        return _Snapshot(self.id, self.store.read(self.path))
+
+    def set(self, data, merge=False):
+        self.store.behaviour.block("firestore set")
+        self.store.write(self.path, data, merge)
+
+    def on_snapshot(self, callback):
+        return self.store.watch(self.path, self.id, callback)
+
+
+class _Collection:
+    def __init__(self, store, name):
+        self.store, self.name = store, name
+
+    def document(self, doc_id=None):
+        return _Document(self.store, self.name, doc_id or f"{random.getrandbits(64):016x}")
+
+    def add(self, data):
+        doc = self.document()
+        doc.set(data)
+        return None, doc
+
+
+class _Batch:
+    def __init__(self, store):
+        self.store = store
+        self.writes = []
+
+    def set(self, doc, data, merge=False):
+        self.writes.append((doc.path, data, merge))
+
+    def commit(self):
+        self.store.behaviour.block("firestore commit")
+        for path, data, merge in self.writes:
+            self.store.write(path, data, merge)
+
+
+class FakeFirestore:
+    def __init__(self, behaviour, documents=None):
+        self.behaviour = behaviour
+        self._docs = dict(documents or {})
+        self._watches = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return _Collection(self, name)
+
+    def batch(self):
+        return _Batch(self)
+
+    def read(self, path):
+        with self._lock:
+            data = self._docs.get(path)
+            return dict(data) if data is not None else None
+
+    def write(self, path, data, merge):
+        with self._lock:
+            current = self._docs.get(path, {}) if merge else {}
+            self._docs[path] = {**current, **data}
+            watches = list(self._watches.get(path, ()))
+        for watch in watches:
+            self._notify(watch)
+
+    def watch(self, path, doc_id, callback):
+        watch = _Watch(self, path, callback)
+        watch.doc_id = doc_id
+        with self._lock:
+            self._watches.setdefault(path, []).append(watch)
+        self._notify(watch)  # the initial snapshot, like the real listener
+        return watch
+
+    def _unwatch(self, path, watch):
+        with self._lock:
+            watches = self._watches.get(path, [])
+            if watch in watches:
+                watches.remove(watch)
+
+    def _notify(self, watch):
+        # Listener callbacks arrive on a background thread in the real SDK too
+        snapshot = _Snapshot(watch.doc_id, self.read(watch.path))
+        threading.Thread(target=watch.callback, args=([snapshot], [], None), daemon=True).start()
+
+
+# --- GEMINI ---
+
+class _Usage:
+    def __init__(self, prompt_token_count):
+        self.prompt_token_count = prompt_token_count
+
+
+class _Response:
+    def __init__(self, text, prompt_tokens):
+        self.text = text
+        self.usage_metadata = _Usage(prompt_tokens)
+
+
+def _has_image(content):
+    return isinstance(content, list) and any(not isinstance(item, str) for item in content)
+
+
+def _reply_text(content):
+    if _has_image(content):
+        if random.random() < 0.8:
+            return "That looks like Sarah!"
+        return "UNKNOWN_PERSON: A man with grey hair and glasses, smiling."
+    if isinstance(content, str) and content.startswith("Extract ONLY the First Name"):
+        return "Arthur"
+    return (f"{random.choice(_OPENERS)}. I remember {random.choice(_SUBJECTS)} "
+            f"from {random.randint(2, 59)} minutes ago. {random.choice(_FOLLOW_UPS)}")
+
+
+def _to_content(role, content):
+    from vertexai.generative_models import Content, Part
+    items = content if isinstance(content, list) else [content]
+    parts = [Part.from_text(item) if isinstance(item, str) else item for item in items]
+    return Content(role=role, parts=parts)
+
+
+def _text_length(content):
+    items = getattr(content, "parts", None) or (content if isinstance(content, list) else [content])
+    length = 0
+    for item in items:
+        if isinstance(item, str):
+            length += len(item)
+            continue
+        try:
+            length += len(item.text)
+        except (AttributeError, ValueError):
+            length += 1000  # an image part; Gemini bills images at a flat rate
+    return length
+
+
+def _prompt_tokens(history, content):
+    return (sum(_text_length(c) for c in history) + _text_length(content)) // 4
+
+
+class FakeChatSession:
+    def __init__(self, model, history=None):
+        self.model = model
+        self._history = list(history or [])
+
+    @property
+    def history(self):
+        return self._history
+
+    async def send_message_async(self, content, stream=False, **kwargs):
+        behaviours = self.model.behaviours
+        prompt_tokens = _prompt_tokens(self._history, content)
+        text = _reply_text(content)
+        if not stream:
+            await behaviours["gemini"].wait("gemini")
+            self._history += [_to_content("user", content), _to_content("model", text)]
+            return _Response(text, prompt_tokens)
+
+        async def chunks():
+            await behaviours["gemini"].wait("gemini")
+            words = text.split(" ")
+            for start in range(0, len(words), 4):
+                if start:
+                    await behaviours["gemini_chunk"].wait("gemini stream")
+                yield _Response(" ".join(words[start:start + 4]) + " ", prompt_tokens)
+            # The SDK records the turn once the stream is consumed
+            self._history += [_to_content("user", content), _to_content("model", text)]
+        return chunks()
+
+
+class FakeGenerativeModel:
+    behaviours = None  # set by install()
+
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name
+
+    def start_chat(self, history=None, **kwargs):
+        return FakeChatSession(self, history)
+
+    async def generate_content_async(self, contents, **kwargs):
+        await self.behaviours["gemini"].wait("gemini")
+        return _Response(_reply_text(contents), _prompt_tokens([], contents))
+
+
+# --- ELEVENLABS ---
+
+class _TextToSpeech:
+    def __init__(self, behaviours):
+        self.behaviours = behaviours
+
+    async def stream(self, text, **kwargs):
+        await self.behaviours["tts"].wait("tts")
+        remaining = max(1, len(text)) * MP3_BYTES_PER_CHAR
+        first = True
+        while remaining > 0:
+            if not first:
+                await self.behaviours["tts_chunk"].wait("tts stream")
+            first = False
+            size = min(TTS_CHUNK_BYTES, remaining)
+            remaining -= size
+            yield b"\xff\xf3" + bytes(size - 2)
+
+    convert = stream
+
+
+class FakeElevenLabs:
+    behaviours = None  # set by install()
+
+    def __init__(self, api_key=None, **kwargs):
+        self.text_to_speech = _TextToSpeech(self.behaviours)
+
+
+# --- SPEECH RECOGNITION ---
+
+class FakeRecognizer:
+    behaviour = None  # set by install()
+    transcripts = TRANSCRIPTS
+
+    def recognize_google(self, audio_data, **kwargs):
+        try:
+            self.behaviour.block("asr")
+        except StandInError as e:
+            raise sr.RequestError(str(e))
+        return random.choice(self.transcripts)
+
+
+def install(table, documents=None):
+    """
+    Swaps the cloud clients for stand-ins. Returns the FakeFirestore.
+    """
+    import vertexai
+    import vertexai.generative_models
+    import elevenlabs.client
+    from firebase_admin import firestore
+
+    db = FakeFirestore(table["firestore"], documents)
+    firebase_admin._apps.setdefault("[DEFAULT]", None)  # main.py skips credential loading
+    firestore.client = lambda *args, **kwargs: db
+    vertexai.init = lambda *args, **kwargs: None
+
+    FakeGenerativeModel.behaviours = table
+    vertexai.generative_models.GenerativeModel = FakeGenerativeModel
+    FakeElevenLabs.behaviours = table
+    elevenlabs.client.AsyncElevenLabs = FakeElevenLabs
+    FakeRecognizer.behaviour = table["asr"]
+    sr.Recognizer = FakeRecognizer
+    return db
@@ -0,0 +1,311 @@
+"""
+Load test: N simulated phones talking to one uvicorn worker, entirely offline.
+
+    python bench_load.py [--clients 20] [--turns 5] [--image-every 4] [--legacy]
+                         [--latency gemini=0.6:0.3 ...] [--fail tts=0.05 ...]
+
+The server (main.py) runs in a child process with bench_fakes stand-ins for
+Firestore, Gemini, ElevenLabs and the recognizer; everything else is real,
+including the ffmpeg decode of the recorded m4a and the photo preprocessing.
+Each client connects to /ws/chat with ?turn_end=1, waits for its session,
+then sends audio_input / image_input frames back to back (plus think time).
+
+Reports turns/s, p50/p95/p99 turn latency and time to first audio per turn
+kind, server RSS per open connection, and the server's own per-stage means
+scraped from /metrics. --latency takes service=median[:sigma] (seconds,
+log-normal), --fail takes service=rate, for the services in
+bench_fakes.DEFAULT_BEHAVIOURS.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+
+import bench_fakes
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def bench_users(count):
+    family = {"Sarah": "daughter, dark curly hair", "Tom": "son, beard and glasses"}
+    return {f"users/bench_{i}": {"name": "Arthur", "family": family} for i in range(count)}
+
+
+def serve(port, latency, fail, clients, log_path):
+    # Child process: stand-ins first, then the real app
+    sys.stdout = sys.stderr = open(log_path or os.devnull, "w", buffering=1)
+    os.environ["ALERT_SPOOL_PATH"] = os.path.join(tempfile.mkdtemp(), "alerts_spool.jsonl")
+    os.environ["TTS_CACHE_DIR"] = ""
+    os.environ.setdefault("MAX_SESSIONS", str(max(200, clients)))
+    bench_fakes.install(bench_fakes.behaviours(latency, fail), bench_users(clients + 1))  # +1: warm-up client
+
+    import uvicorn
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def scrape(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        return response.read().decode()
+
+
+def wait_until_up(port, server, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not server.is_alive():
+            raise SystemExit("Server process exited during startup (see --server-log)")
+        try:
+            return scrape(port)
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("Server did not come up")
+
+
+def metric_value(text, name):
+    match = re.search(rf"^{name} ([0-9.e+-]+)$", text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def stage_means(text, name):
+    # {stage: (count, total seconds)} from a labelled histogram's _count/_sum lines
+    totals = {}
+    for suffix, slot in (("count", 0), ("sum", 1)):
+        for stage, value in re.findall(rf'^{name}_{suffix}{{stage="([^"]+)"}} ([0-9.e+-]+)$', text, re.M):
+            totals.setdefault(stage, [0.0, 0.0])[slot] = float(value)
+    return totals
+
+
+def diff_stage_means(before, after):
+    rows = {}
+    for stage, (count, total) in after.items():
+        old_count, old_total = before.get(stage, (0.0, 0.0))
+        if count - old_count > 0:
+            rows[stage] = (count - old_count, (total - old_total) / (count - old_count))
+    return rows
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def photo_frames(path, variants):
+    if path:
+        with open(path, "rb") as f:
+            photos = [f.read()]
+    else:
+        from PIL import Image, ImageDraw
+        rng = random.Random(3)
+        photos = []
+        for _ in range(max(1, variants)):
+            # A 12 MP "phone photo" of a face-ish blob; variants differ enough to miss the vision cache
+            image = Image.new("RGB", (4000, 3000), tuple(rng.randrange(150, 255) for _ in range(3)))
+            draw = ImageDraw.Draw(image)
+            x, y = rng.randrange(400, 2000), rng.randrange(300, 1000)
+            draw.ellipse((x, y, x + 1800, y + 1800), fill="peachpuff")
+            draw.rectangle((x + 400, y + 700, x + 1400, y + 900), fill="black")
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=92)
+            photos.append(out.getvalue())
+    return [json.dumps({"type": "image_input", "data": base64.b64encode(p).decode()}) for p in photos]
+
+
+class Results:
+    def __init__(self):
+        self.turns = []  # (kind, latency, first_audio or None, ok)
+        self.connects = []
+        self.rejected = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.settled = 0  # clients done sending (finished, failed or dropped)
+
+
+async def run_client(index, port, args, audio_frame, image_frames, results, release):
+    await asyncio.sleep(index * args.ramp / max(1, args.clients))
+    url = f"ws://127.0.0.1:{port}/ws/chat?user_id=bench_{index}&turn_end=1"
+    if not args.legacy:
+        url += "&audio=stream"
+    try:
+        started = time.perf_counter()
+        async with websockets.connect(url, max_size=None, open_timeout=args.timeout) as ws:
+            await wait_turn_end(ws, args.timeout)
+            results.connects.append(time.perf_counter() - started)
+            for turn in range(args.turns):
+                is_image = args.image_every and (turn + 1) % args.image_every == 0
+                frame = random.choice(image_frames) if is_image else audio_frame
+                sent = time.perf_counter()
+                await ws.send(frame)
+                try:
+                    first_audio, ok = await wait_turn_end(ws, args.timeout)
+                except asyncio.TimeoutError:
+                    results.timeouts += 1
+                    break
+                latency = time.perf_counter() - sent
+                results.turns.append(("image" if is_image else "audio", latency,
+                                      first_audio - sent if first_audio else None, ok))
+                if args.think:
+                    await asyncio.sleep(random.uniform(0, 2 * args.think))
+            # Stay connected until every client is done, so memory is measured at full load
+            results.settled += 1
+            await release.wait()
+            return
+    except websockets.ConnectionClosed as e:
+        if e.rcvd and e.rcvd.code == 1013:
+            results.rejected += 1
+        else:
+            results.dropped += 1
+    except (OSError, asyncio.TimeoutError):
+        results.dropped += 1
+    results.settled += 1
+
+
+async def wait_turn_end(ws, timeout):
+    first_audio = None
+    while True:
+        message = await asyncio.wait_for(ws.recv(), timeout)
+        if isinstance(message, bytes):
+            first_audio = first_audio or time.perf_counter()
+            continue
+        data = json.loads(message)
+        if data.get("type") == "audio":
+            first_audio = first_audio or time.perf_counter()
+        elif data.get("type") == "turn_end":
+            return first_audio, data.get("ok", True)
+
+
+async def warm_up(port, args, audio_frame, image_frames):
+    # One extra client pays for first-use costs (thread pools, codecs) before the memory baseline
+    once = argparse.Namespace(**{**vars(args), "turns": 2, "image_every": 2 if image_frames else 0})
+    results = Results()
+    release = asyncio.Event()
+    release.set()
+    for _ in range(3):  # a failed session setup closes the socket; devices reconnect
+        await run_client(args.clients, port, once, audio_frame, image_frames, results, release)
+        if results.turns:
+            break
+    if not results.turns:
+        raise SystemExit("Warm-up client got no replies (see --server-log)")
+
+
+async def drive(port, args, audio_frame, image_frames):
+    results = Results()
+    release = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(run_client(i, port, args, audio_frame, image_frames, results, release))
+             for i in range(args.clients)]
+    while results.settled < args.clients:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    # Sampled while every surviving client is still connected
+    loaded = await loop.run_in_executor(None, scrape, port)
+    release.set()
+    await asyncio.gather(*tasks)
+    return results, elapsed, loaded
+
+
+def report(args, results, elapsed, before, loaded, baseline_rss):
+    turns = results.turns
+    print(f"\n{args.clients} clients x {args.turns} turns in {elapsed:.1f}s: "
+          f"{len(turns) / elapsed:.2f} turns/s "
+          f"({sum(1 for t in turns if not t[3])} failed, {results.timeouts} timed out, "
+          f"{results.rejected} rejected, {results.dropped} dropped)")
+    if results.connects:
+        print(f"  connect     p50 {percentile(results.connects, .5) * 1000:7.0f}ms  "
+              f"p95 {percentile(results.connects, .95) * 1000:7.0f}ms")
+
+    print(f"\n  {'kind':<7}{'turns':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'audio p50':>11}{'audio p95':>11}{'audio p99':>11}")
+    for kind in ("audio", "image"):
+        rows = [t for t in turns if t[0] == kind]
+        if not rows:
+            continue
+        latency = [t[1] for t in rows]
+        first = [t[2] for t in rows if t[2] is not None]
+        print(f"  {kind:<7}{len(rows):>6}"
+              + "".join(f"{percentile(latency, q) * 1000:>9.0f}" for q in (.5, .95, .99))
+              + "".join(f"{percentile(first, q) * 1000:>11.0f}" for q in (.5, .95, .99)))
+
+    rss = metric_value(loaded, "process_resident_memory_bytes")
+    sessions = metric_value(loaded, "myra_sessions")
+    connections = metric_value(loaded, "myra_ws_connections")
+    if rss and baseline_rss:
+        open_count = max(1.0, connections or args.clients)
+        print(f"\n  server RSS {baseline_rss / 2**20:.0f} MiB idle -> {rss / 2**20:.0f} MiB with "
+              f"{connections:.0f} connections / {sessions:.0f} sessions: "
+              f"{(rss - baseline_rss) / open_count / 1024:.0f} KiB per connection")
+
+    print(f"\n  {'server stage':<18}{'calls':>7}{'mean ms':>9}{'queued ms':>11}")
+    spans = diff_stage_means(stage_means(before, "myra_stage_seconds"), stage_means(loaded, "myra_stage_seconds"))
+    queued = diff_stage_means(stage_means(before, "myra_stage_queue_seconds"),
+                              stage_means(loaded, "myra_stage_queue_seconds"))
+    for stage, (count, mean) in sorted(spans.items(), key=lambda row: -row[1][0] * row[1][1]):
+        wait = queued.get(stage)
+        print(f"  {stage:<18}{count:>7.0f}{mean * 1000:>9.1f}"
+              + (f"{wait[1] * 1000:>11.1f}" if wait else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5, help="messages per client")
+    parser.add_argument("--image-every", type=int, default=4, help="every Nth message is a photo (0 = never)")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a reply and the next message")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which clients connect")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--legacy", action="store_true", help="base64 audio frames instead of ?audio=stream")
+    parser.add_argument("--audio", default=os.path.join(HERE, "temp_input.m4a"), help="recorded clip to send")
+    parser.add_argument("--image", help="photo to send (default: synthetic 12 MP JPEGs)")
+    parser.add_argument("--photo-variants", type=int, default=4)
+    parser.add_argument("--latency", nargs="*", default=[], metavar="SERVICE=MEDIAN[:SIGMA]")
+    parser.add_argument("--fail", nargs="*", default=[], metavar="SERVICE=RATE")
+    parser.add_argument("--server-log", help="file for the server's own output")
+    args = parser.parse_args()
+
+    table = bench_fakes.behaviours(args.latency, args.fail)  # validates the overrides early
+    print("Stand-ins: " + ", ".join(f"{name} {behaviour}" for name, behaviour in table.items()))
+
+    with open(args.audio, "rb") as f:
+        audio_frame = json.dumps({"type": "audio_input", "data": base64.b64encode(f.read()).decode()})
+    image_frames = photo_frames(args.image, args.photo_variants) if args.image_every else []
+
+    port = free_port()
+    server = multiprocessing.get_context("spawn").Process(
+        target=serve, args=(port, args.latency, args.fail, args.clients, args.server_log), daemon=True)
+    server.start()
+    try:
+        wait_until_up(port, server)
+        time.sleep(1.0)  # let the startup TTS pre-warm finish
+        asyncio.run(warm_up(port, args, audio_frame, image_frames))
+        before = scrape(port)
+        baseline_rss = metric_value(before, "process_resident_memory_bytes")
+        results, elapsed, loaded = asyncio.run(drive(port, args, audio_frame, image_frames))
+        report(args, results, elapsed, before, loaded, baseline_rss)
+    finally:
+        server.terminate()
+        server.join(5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Safety classifier benchmark: accuracy on the labelled corpus and per-utterance
+latency as the phrase list grows.
+
+    python bench_safety.py [--corpus safety_corpus.jsonl] [--sizes 25 100 300 600]
+
+Extra phrases for the scaling runs are synthetic multi-word CRISIS/WANDERING
+entries, so the automaton really grows; the corpus is classified with each.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from safety import SafetyClassifier, DEFAULT_CONFIG_PATH
+
+HERE = os.path.dirname(__file__)
+
+
+def legacy_check_safety_risk(text):
+    # The substring matcher this engine replaced, kept for comparison
+    text = text.lower()
+    crisis_keywords = ["help me", "i fell", "fallen", "pain", "bleeding", "hurt myself", "emergency"]
+    for word in crisis_keywords:
+        if word in text: return "CRISIS"
+    wandering_keywords = ["want to go home", "where is the door", "let me out", "who are you people"]
+    for word in wandering_keywords:
+        if word in text: return "WANDERING"
+    return "SAFE"
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def score(classify, corpus, labels):
+    print(f"  {'label':<11}{'precision':>10}{'recall':>8}{'tp':>5}{'fp':>5}{'fn':>5}")
+    mistakes = []
+    for label in labels:
+        tp = fp = fn = 0
+        for item in corpus:
+            predicted = classify(item["text"])
+            if predicted == label and item["label"] == label: tp += 1
+            elif predicted == label: fp += 1
+            elif item["label"] == label: fn += 1
+        precision = tp / (tp + fp) if tp + fp else 1.0
+        recall = tp / (tp + fn) if tp + fn else 1.0
+        print(f"  {label:<11}{precision:>10.2f}{recall:>8.2f}{tp:>5}{fp:>5}{fn:>5}")
+    for item in corpus:
+        predicted = classify(item["text"])
+        if predicted != item["label"]:
+            mistakes.append(f"    {item['label']:>9} -> {predicted:<9} {item['text']}")
+    if mistakes:
+        print("  misclassified:")
+        print("\n".join(mistakes))
+
+
+def grown_config(config, size, rng):
+    vocabulary = ["please", "my", "the", "water", "kitchen", "leg", "arm", "stairs", "car", "keys",
+                  "garden", "medicine", "phone", "bed", "chair", "coat", "bus", "station", "sister"]
+    verbs = ["lost", "broke", "dropped", "burned", "need", "find", "cut", "twisted", "fetch", "missed"]
+    phrases = {severity: list(entries) for severity, entries in config["phrases"].items()}
+    total = sum(len(entries) for entries in phrases.values())
+    severities = list(phrases)
+    while total < size:
+        phrase = " ".join([rng.choice(verbs)] + rng.sample(vocabulary, rng.randint(1, 3)))
+        phrases[rng.choice(severities)].append(phrase)
+        total += 1
+    return {**config, "phrases": phrases}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default=os.path.join(HERE, "safety_corpus.jsonl"))
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[25, 100, 300, 600])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    with open(args.config, encoding="utf-8") as f:
+        config = json.load(f)
+    classifier = SafetyClassifier.from_config(config)
+    labels = classifier.severities
+
+    print(f"Corpus: {len(corpus)} labelled utterances\n")
+    print("Legacy substring matcher")
+    score(legacy_check_safety_risk, corpus, labels)
+    print("\nSafetyClassifier")
+    score(lambda text: classifier.classify(text).severity, corpus, labels)
+
+    print(f"\nLatency per utterance ({args.rounds} passes over the corpus)")
+    print(f"  {'phrases':>8}{'compile ms':>12}{'mean us':>10}{'p99 us':>9}{'cold us':>10}")
+    rng = random.Random(7)
+    texts = [item["text"] for item in corpus]
+    for size in args.sizes:
+        start = time.perf_counter()
+        engine = SafetyClassifier.from_config(grown_config(config, size, rng))
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        # First pass pays for canonicalising (and fuzzy-correcting) new words
+        start = time.perf_counter()
+        for text in texts: engine.classify(text)
+        cold_us = (time.perf_counter() - start) / len(texts) * 1e6
+
+        samples = []
+        for _ in range(args.rounds):
+            for text in texts:
+                t0 = time.perf_counter()
+                engine.classify(text)
+                samples.append(time.perf_counter() - t0)
+        samples.sort()
+        mean_us = sum(samples) / len(samples) * 1e6
+        p99_us = samples[int(len(samples) * 0.99)] * 1e6
+        print(f"  {size:>8}{compile_ms:>12.1f}{mean_us:>10.1f}{p99_us:>9.1f}{cold_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import time
+import asyncio
+from vertexai.generative_models import Content, Part
+
+import metrics
+
+# --- CONVERSATION CONTEXT ---
+# Keeps a ChatSession's history bounded for all-day conversations:
+#   [preamble: system prompt + profile] [rolling summary] [last N turns verbatim]
+# Once more than keep_turns + summarize_batch turns pile up, the oldest
+# summarize_batch turns are folded into the summary by a background Gemini
+# call; they stay in the history until the summary is ready, so nothing is
+# ever lost mid-turn. Photos are swapped for their description once answered.
+
+SUMMARY_ACK = "Understood. I remember our earlier conversation."
+
+
+def content_text(content):
+    pieces = []
+    for part in content.parts:
+        try:
+            pieces.append(part.text)
+        except (AttributeError, ValueError):
+            pieces.append("[image]")
+    return " ".join(pieces).strip()
+
+
+def text_content(role, text):
+    return Content(role=role, parts=[Part.from_text(text)])
+
+
+def photo_note(description):
+    return f"[The user showed Myra a photo. Myra saw: {description}]"
+
+
+class ConversationContext:
+    def __init__(self, chat, summarize, keep_turns=6, summarize_batch=4):
+        """
+        summarize: async (previous_summary, transcript) -> new summary text.
+        Everything already in the chat's history counts as the preamble and is never trimmed.
+        """
+        self.chat = chat
+        self.summarize = summarize
+        self.keep_turns = keep_turns
+        self.summarize_batch = summarize_batch
+        self.preamble = len(chat.history)
+        self.summary = None
+        self._task = None
+        self.turns = 0
+        self.last_prompt_tokens = None
+
+    @property
+    def _turns_start(self):
+        # Index of the first verbatim turn (after preamble and the summary pair)
+        return self.preamble + (2 if self.summary else 0)
+
+    def record_turn(self, prompt_tokens, latency):
+        self.turns += 1
+        self.last_prompt_tokens = prompt_tokens
+        if prompt_tokens:
+            metrics.PROMPT_TOKENS.observe(prompt_tokens)
+        history = self.chat.history
+        print(f"📏 Turn {self.turns}: prompt_tokens={prompt_tokens} latency={latency:.2f}s "
+              f"history={len(history)} contents (summary={'yes' if self.summary else 'no'})")
+
+    def replace_last_image(self, description):
+        """
+        After a vision turn, keeps only the answer's text instead of the photo bytes.
+        """
+        history = self.chat.history
+        if len(history) < 2 or len(history) - 2 < self._turns_start:
+            return
+        history[-2] = text_content("user", photo_note(description))
+
+    def add_image_turn(self, description):
+        """
+        Records a photo answered from the vision cache, as if Gemini had seen it.
+        """
+        self.chat.history.extend([text_content("user", photo_note(description)), text_content("model", description)])
+
+    def maintain(self):
+        """
+        Starts a background summarization when the verbatim window overflows.
+        """
+        if self._task is not None and not self._task.done():
+            return
+        history = self.chat.history
+        verbatim = (len(history) - self._turns_start) // 2
+        if verbatim <= self.keep_turns + self.summarize_batch - 1:
+            return
+        start = self._turns_start
+        folded = history[start:start + 2 * self.summarize_batch]
+        self._task = asyncio.create_task(self._fold(folded))
+
+    async def _fold(self, folded):
+        transcript = "\n".join(f"{c.role}: {content_text(c)}" for c in folded)
+        started = time.perf_counter()
+        try:
+            summary = await self.summarize(self.summary, transcript)
+        except Exception as e:
+            print(f"⚠️ Context summary failed, keeping turns verbatim: {e}")
+            return
+        if not summary:
+            return
+
+        history = self.chat.history
+        start = self._turns_start
+        # Only splice if the folded turns are still exactly where we left them
+        if history[start:start + len(folded)] != folded:
+            return
+        had_summary = self.summary is not None
+        self.summary = summary
+        summary_pair = [
+            text_content("user", f"EARLIER IN THIS CONVERSATION (summary): {summary}"),
+            text_content("model", SUMMARY_ACK),
+        ]
+        summary_start = self.preamble
+        # In-place so the ChatSession (and any turn in flight) sees the same list
+        history[summary_start:start + len(folded)] = summary_pair
+        print(f"🗜️ Folded {len(folded) // 2} turns into summary in {time.perf_counter() - started:.2f}s "
+              f"({'updated' if had_summary else 'new'}; history now {len(history)} contents)")
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
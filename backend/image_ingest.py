@@ -0,0 +1,96 @@
+import io
+import hashlib
+from collections import namedtuple
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# --- IMAGE INGEST ---
+# Phone photos arrive as multi-megabyte, full-resolution files in whatever
+# format the camera used. Before a vision call each one is:
+#   * sniffed for its real format (never assumed to be JPEG)
+#   * downsized to MAX_EDGE on its longest side and re-encoded as JPEG
+#     (EXIF rotation applied first, so faces stay upright)
+#   * fingerprinted with a 64-bit perceptual hash (dHash), so near-identical
+#     frames can share one cached description, and with a SHA-256 digest of
+#     the bytes sent, for caches that must only reuse an answer for the same photo
+# Formats Pillow cannot open (e.g. HEIC) are passed through untouched with
+# their real MIME type and no hash.
+
+MAX_EDGE = 1024      # Gemini downsamples larger images anyway
+JPEG_QUALITY = 85
+
+PreparedImage = namedtuple("PreparedImage", "data mime_type phash original_bytes digest")
+
+
+class ImageDecodeError(Exception):
+    pass
+
+
+def sniff_mime_type(data):
+    """
+    Returns the image MIME type from the file's magic bytes, or None.
+    """
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp":
+        brand = data[8:12]
+        if brand in (b"heic", b"heix", b"heim", b"heis", b"mif1", b"msf1"):
+            return "image/heic"
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+    return None
+
+
+def dhash(image, size=8):
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of a
+    (size+1) x size greyscale thumbnail. Robust to re-compression and resizing.
+    """
+    pixels = list(image.convert("L").resize((size + 1, size), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def prepare_image(data, max_edge=MAX_EDGE, quality=JPEG_QUALITY):
+    """
+    Raw upload -> PreparedImage ready for Part.from_data. Blocking (CPU bound).
+    """
+    mime_type = sniff_mime_type(data)
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEG: let libjpeg decode at a reduced scale instead of full resolution
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge))
+    except (UnidentifiedImageError, OSError) as e:
+        if mime_type is None:
+            raise ImageDecodeError(f"unrecognised image ({len(data)} bytes)") from e
+        return PreparedImage(data, mime_type, None, len(data), _digest(data))
+
+    phash = dhash(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True)
+    encoded = out.getvalue()
+    if mime_type == "image/jpeg" and len(data) <= len(encoded):
+        # Already small: re-encoding would only cost quality
+        return PreparedImage(data, mime_type, phash, len(data), _digest(data))
+    return PreparedImage(encoded, "image/jpeg", phash, len(data), _digest(encoded))
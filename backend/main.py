@@ -3,9 +3,11 @@ import json
 import base64
 import asyncio
 import re
-from datetime import datetime
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.websockets import WebSocketState
 from fastapi.responses import Response
 from pydantic import BaseModel 
 from dotenv import load_dotenv
@@ -13,19 +15,47 @@ from dotenv import load_dotenv
 # Cloud Services
 import vertexai
 from vertexai.generative_models import GenerativeModel, ChatSession, Part
-from elevenlabs.client import ElevenLabs 
+from elevenlabs.client import AsyncElevenLabs
 from elevenlabs import VoiceSettings      
 
 import firebase_admin
 from firebase_admin import credentials, firestore
 import speech_recognition as sr
-from pydub import AudioSegment
 import io
 
+from stages import ASR, LLM, TTS, DB, IMAGE, shutdown_stages
+from audio_ingest import decode_audio
+from image_ingest import prepare_image
+from reply_pipeline import speak, split_sentences, chain_sentences, sentences_from_stream, sentences_from_text
+from tts_cache import TTSCache, cache_key, load_prewarm_phrases
+from vision_cache import VisionCache, family_fingerprint
+from profile_cache import ProfileCache
+from safety import SafetyClassifier, load_classifier
+from alerts import AlertDispatcher
+from sessions import SessionManager, SessionLimitError
+from context import ConversationContext
+import metrics
+
 # Load Environment Variables
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    background = [
+        asyncio.create_task(prewarm_tts_cache()),
+        asyncio.create_task(evict_idle_profiles()),
+        asyncio.create_task(refresh_safety_phrases()),
+        asyncio.create_task(evict_idle_sessions()),
+    ]
+    await alerts.start()
+    yield
+    for task in background:
+        task.cancel()
+    await alerts.stop()
+    profiles.close()
+    shutdown_stages()
+
+app = FastAPI(lifespan=lifespan)
 
 # ✅ ALLOW DASHBOARD TO TALK TO PYTHON
 app.add_middleware(
@@ -41,6 +71,23 @@ PROJECT_ID = os.getenv("PROJECT_ID")
 LOCATION = os.getenv("LOCATION")
 ELEVEN_KEY = os.getenv("ELEVENLABS_API_KEY")
 VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "piTKgcLEGmPE4e6mEKli") 
+TTS_OUTPUT_FORMAT = "mp3_22050_32"
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR")  # unset = memory-only cache
+TTS_CACHE_DISK_MAX_BYTES = int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024))
+TTS_PREWARM_FILE = os.getenv("TTS_PREWARM_FILE")
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", 60))       # used only while a listener is down
+PROFILE_CACHE_IDLE = float(os.getenv("PROFILE_CACHE_IDLE", 30 * 60))
+ALERT_DEDUP_WINDOW = float(os.getenv("ALERT_DEDUP_WINDOW", 120))
+ALERT_SPOOL_PATH = os.getenv("ALERT_SPOOL_PATH", "alerts_spool.jsonl")
+DEFAULT_USER_ID = os.getenv("DEFAULT_USER_ID", "arthur_01")  # clients that don't send ?user_id=
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", 200))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", 15 * 60))
+SESSION_MEMORY_BUDGET = int(os.getenv("SESSION_MEMORY_BUDGET", 256 * 1024 * 1024))
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", 6))        # verbatim turns kept in the prompt
+CONTEXT_SUMMARIZE_BATCH = int(os.getenv("CONTEXT_SUMMARIZE_BATCH", 4))  # older turns folded per summary call
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", 1024))              # longest side sent to Gemini
+VISION_CACHE_DISTANCE = int(os.getenv("VISION_CACHE_DISTANCE", 6))   # max differing hash bits for a repeat dashboard photo
 # This variable might be a path (local) or the actual JSON string (Render)
 CREDENTIALS_VAL = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
@@ -74,12 +121,27 @@ try:
 except TypeError:
     db = firestore.client() 
 
+# Profiles stay in memory, kept fresh by a Firestore listener per active user
+profiles = ProfileCache(db, ttl=PROFILE_CACHE_TTL, idle_ttl=PROFILE_CACHE_IDLE)
+
+# Alerts are written behind the conversation (batched, deduplicated, spooled on failure)
+alerts = AlertDispatcher(db, DB.run, window=ALERT_DEDUP_WINDOW, spool_path=ALERT_SPOOL_PATH)
+
 # 2. Initialize Vertex AI
 vertexai.init(project=PROJECT_ID, location=LOCATION)
 model = GenerativeModel("gemini-2.0-flash-exp") 
 
-# 3. Initialize ElevenLabs
-eleven = ElevenLabs(api_key=ELEVEN_KEY)
+# 3. Initialize ElevenLabs (async client, so synthesis never blocks the loop)
+eleven = AsyncElevenLabs(api_key=ELEVEN_KEY)
+tts_cache = TTSCache(TTS_CACHE_MAX_BYTES, TTS_CACHE_DIR, TTS_CACHE_DISK_MAX_BYTES)
+
+# Repeat photos are answered from here instead of Gemini (emptied when the family changes)
+vision_cache = VisionCache(max_distance=VISION_CACHE_DISTANCE)
+
+# --- CANNED PHRASES (pre-synthesized at startup so they play instantly) ---
+ONBOARDING_GREETING = "Hello. I don't think we've been introduced. What is your name?"
+CRISIS_SCRIPT = "Stay still. I'm calling your family now."
+UNKNOWN_FACE_REPLY = "I don't recognize them yet, but I have asked Sarah to update my memory."
 
 # --- DATABASE HELPERS ---
 
@@ -87,256 +149,473 @@ def sanitize_firestore_key(text):
     clean_text = re.sub(r'[^a-zA-Z0-9]', '_', text)
     return clean_text.strip('_')
 
-def get_user_profile(user_id="arthur_01"):
-    try:
-        doc = db.collection("users").document(user_id).get()
-        if doc.exists:
-            data = doc.to_dict()
-            name = data.get("name", "Unknown")
-            if name == "Unknown" or name == "":
-                return None, data 
-            return name, data
-        return None, {}
-    except Exception as e:
-        print(f"⚠️ Firestore Error: {e}")
+def parse_user_profile(data):
+    if data is None:
         return None, {}
+    name = data.get("name", "Unknown")
+    if name == "Unknown" or name == "":
+        return None, data 
+    return name, data
+
+def get_user_profile(user_id=DEFAULT_USER_ID):
+    # A failed read raises: treating it as "no name yet" would start onboarding
+    # and overwrite the stored name with the user's next utterance
+    return parse_user_profile(profiles.get(user_id))
+
+async def load_user_profile(user_id=DEFAULT_USER_ID):
+    """
+    Served straight from the profile cache when fresh; otherwise one read on the DB stage.
+    """
+    hit, data = profiles.peek(user_id)
+    if hit:
+        return parse_user_profile(data)
+    return await DB.run(get_user_profile, user_id)
+
+async def evict_idle_profiles():
+    while True:
+        await asyncio.sleep(60)
+        try: await DB.run(profiles.evict_idle)
+        except Exception as e: print(f"⚠️ Profile cache sweep failed: {e}")
 
 def update_user_name(user_id, new_name):
     try:
-        db.collection("users").document(user_id).set({
-            "name": new_name
-        }, merge=True)
+        profiles.update(user_id, {"name": new_name})
         print(f"💾 Saved new name to DB: {new_name}")
     except Exception as e:
         print(f"⚠️ Firestore Write Error: {e}")
 
 # --- SAFETY HELPERS ---
 
-def trigger_family_alert(user_name, alert_type, message):
+def trigger_family_alert(user_id, user_name, alert_type, message):
+    """
+    Queues the alert and returns immediately; CRISIS alerts are written first.
+    """
+    alerts.submit(user_id, user_name, alert_type, message)
+    print(f"🚨 ALERT QUEUED FOR FAMILY: [{alert_type}] {user_id}: {message}")
+
+# Phrases come from safety_phrases.json (or SAFETY_PHRASES_FILE) and can be
+# overridden from Firestore: config/safety_phrases, same shape as the file.
+safety_classifier = load_classifier()
+
+def load_safety_config():
+    doc = db.collection("config").document("safety_phrases").get()
+    return doc.to_dict() if doc.exists else None
+
+async def refresh_safety_phrases():
+    global safety_classifier
     try:
-        alert_data = {
-            "user_name": user_name,
-            "type": alert_type, 
-            "message": message,
-            "timestamp": datetime.now(),
-            "status": "active"
-        }
-        db.collection("alerts").add(alert_data)
-        print(f"🚨 ALERT SENT TO FAMILY: [{alert_type}] {message}")
+        config = await DB.run(load_safety_config)
+        if config:
+            safety_classifier = SafetyClassifier.from_config(config)
+            print(f"🛡️ Loaded safety phrases from Firestore ({', '.join(safety_classifier.severities)})")
     except Exception as e:
-        print(f"❌ Failed to send alert: {e}")
+        print(f"⚠️ Using bundled safety phrases: {e}")
 
 def check_safety_risk(text):
-    text = text.lower()
-    crisis_keywords = ["help me", "i fell", "fallen", "pain", "bleeding", "hurt myself", "emergency"]
-    for word in crisis_keywords:
-        if word in text: return "CRISIS"
-    wandering_keywords = ["want to go home", "where is the door", "let me out", "who are you people"]
-    for word in wandering_keywords:
-        if word in text: return "WANDERING"
-    return "SAFE"
+    """
+    Returns SafetyResult(severity, phrase): severity is CRISIS, WANDERING or SAFE.
+    """
+    with metrics.span("safety"):
+        return safety_classifier.classify(text)
 
 # --- AI HELPERS ---
 
-def extract_name_with_gemini(user_text):
+async def extract_name_with_gemini(user_text):
     prompt = f"Extract ONLY the First Name. Input: 'I am Arthur' -> Arthur. Text: {user_text}"
     try:
-        response = model.generate_content(prompt)
+        response = await LLM.call(model.generate_content_async, prompt)
         return response.text.strip().replace('"', '').replace('.', '')
     except: return "Friend"
 
-def transcribe_audio(file_path):
+def transcode_and_transcribe(audio_bytes):
+    """
+    Blocking m4a -> PCM -> text step (all in memory). Runs on the ASR stage pool.
+    """
+    with metrics.span("transcode"):
+        audio_data = decode_audio(audio_bytes)
+    return transcribe_audio(audio_data)
+
+def transcribe_audio(audio_data):
     recognizer = sr.Recognizer()
-    with sr.AudioFile(file_path) as source:
-        audio_data = recognizer.record(source)
+    with metrics.span("transcribe"):
         try: return recognizer.recognize_google(audio_data)
-        except: return ""
+        except sr.UnknownValueError: return ""  # silence / unintelligible: not an error
+        except Exception as e:
+            metrics.STAGE_ERRORS.labels("transcribe", type(e).__name__).inc()
+            return ""
 
-def text_to_speech(text):
+async def ingest_image(image_bytes):
     """
-    Generates audio using ElevenLabs.
+    Real format, bounded size and perceptual hash of an uploaded photo (IMAGE stage).
     """
-    try:
-        audio_generator = eleven.text_to_speech.convert(
-            voice_id=VOICE_ID,
-            optimize_streaming_latency="0",
-            output_format="mp3_22050_32",
-            text=text,
-            model_id="eleven_turbo_v2",
-            voice_settings=VoiceSettings(
-                stability=0.8,
-                similarity_boost=0.75,
-                style=0.0,
-                use_speaker_boost=True
-            )
+    image = await IMAGE.run(prepare_image, image_bytes, IMAGE_MAX_EDGE)
+    print(f"🖼️ Image {image.original_bytes // 1024} KB -> {len(image.data) // 1024} KB ({image.mime_type})")
+    return image
+
+def tts_request(text):
+    return dict(
+        voice_id=VOICE_ID,
+        optimize_streaming_latency="0",
+        output_format=TTS_OUTPUT_FORMAT,
+        text=text,
+        model_id="eleven_turbo_v2",
+        voice_settings=VoiceSettings(
+            stability=0.8,
+            similarity_boost=0.75,
+            style=0.0,
+            use_speaker_boost=True
         )
-        return base64.b64encode(b"".join(audio_generator)).decode('utf-8')
-    except Exception as e:
-        print(f"❌ ElevenLabs Error: {e}")
-        return None
+    )
+
+def tts_cache_key(request):
+    return cache_key(request["text"], request["voice_id"], request["model_id"],
+                     request["output_format"], request["voice_settings"])
+
+def is_tts_cached(text):
+    sentences, rest = split_sentences(text)
+    sentences += [rest] if rest.strip() else []
+    return all(tts_cache.contains(tts_cache_key(tts_request(s))) for s in sentences)
+
+async def text_to_speech(text):
+    """
+    Generates audio using ElevenLabs, yielding mp3 chunks as they arrive.
+    Repeated sentences are served from the TTS cache.
+    """
+    request = tts_request(text)
+    key = tts_cache_key(request)
+    cached = await asyncio.to_thread(tts_cache.get, key)
+    if cached:
+        yield cached
+        return
+
+    chunks = []
+    async for chunk in TTS.stream(eleven.text_to_speech.stream, **request):
+        chunks.append(chunk)
+        yield chunk
+    await asyncio.to_thread(tts_cache.put, key, b"".join(chunks))
+
+async def prewarm_tts_cache():
+    phrases = load_prewarm_phrases(TTS_PREWARM_FILE, [ONBOARDING_GREETING, CRISIS_SCRIPT, UNKNOWN_FACE_REPLY])
+    warmed = 0
+    for phrase in phrases:
+        async for sentence in sentences_from_text(phrase):
+            # Pinned, so neither cache tier ever evicts the crisis script or greeting
+            key = tts_cache_key(tts_request(sentence))
+            if await asyncio.to_thread(tts_cache.pin, key):
+                continue
+            try:
+                async for _ in text_to_speech(sentence): pass
+                await asyncio.to_thread(tts_cache.pin, key)
+                warmed += 1
+            except Exception as e:
+                print(f"⚠️ TTS pre-warm failed for '{sentence}': {e}")
+    print(f"🔥 TTS cache pre-warmed ({warmed} new sentences): {tts_cache.stats()}")
+
+def prompt_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "prompt_token_count", None) or None
+
+async def gemini_text_stream(chat, content, usage=None):
+    responses = await chat.send_message_async(content, stream=True)
+    async for response in responses:
+        if usage is not None:
+            usage["prompt_tokens"] = prompt_tokens(response) or usage.get("prompt_tokens")
+        try: yield response.text
+        except (ValueError, AttributeError): continue  # e.g. final chunk carrying only the finish reason
+
+async def summarize_turns(previous_summary, transcript):
+    prompt = f"""
+    Update the running summary of a conversation between Myra (a companion) and an elderly user.
+    Keep names, people mentioned, feelings, health or safety events and anything Myra promised.
+    Under 120 words, plain sentences.
+    PREVIOUS SUMMARY: {previous_summary or "(none)"}
+    NEW TURNS:
+    {transcript}
+    """
+    response = await LLM.call(model.generate_content_async, prompt)
+    return response.text.strip()
+
+def new_context(chat):
+    return ConversationContext(chat, summarize_turns, CONTEXT_KEEP_TURNS, CONTEXT_SUMMARIZE_BATCH)
+
+async def reply_with_speech(websocket, session, content, stream_audio, opener=None):
+    """
+    Streams Gemini's reply to content and speaks it sentence by sentence.
+    An opener (canned, usually cached) is spoken before the model's first sentence.
+    """
+    started = time.perf_counter()
+    usage = {}
+    text_chunks = LLM.stream(gemini_text_stream, session.chat, content, usage)
+    sentences = sentences_from_stream(text_chunks)
+    if opener:
+        sentences = chain_sentences(sentences_from_text(opener), sentences)
+    ai_text = await speak(websocket, sentences, text_to_speech, stream_audio, TTS_OUTPUT_FORMAT)
+    session.context.record_turn(usage.get("prompt_tokens"), time.perf_counter() - started)
+    session.context.maintain()
+    return ai_text
+
+async def send_reply(websocket, ai_text, stream_audio):
+    """
+    Speaks an already known reply, falling back to text if TTS fails.
+    """
+    return await speak(websocket, sentences_from_text(ai_text), text_to_speech, stream_audio, TTS_OUTPUT_FORMAT)
+
+# --- SESSIONS ---
+
+# One ChatSession per user, surviving the phone's quick reconnects
+sessions = SessionManager(MAX_SESSIONS, SESSION_IDLE_TTL, SESSION_MEMORY_BUDGET)
+metrics.SESSIONS.set_function(lambda: len(sessions))
+
+async def evict_idle_sessions():
+    while True:
+        await asyncio.sleep(30)
+        sessions.evict()
 
 # --- WEBSOCKET ENDPOINT ---
 
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    print("📱 Client Connected")
-    
-    user_name, user_data = get_user_profile("arthur_01")
-    mode = "ONBOARDING" if user_name is None else "COMPANION"
-    
-    if mode == "COMPANION":
-        SYSTEM_PROMPT = f"""
-        You are "Myra," a warm, patient companion for {user_name}.
-        PROFILE: {json.dumps(user_data)}
-        1. Speak in SHORT sentences.
-        2. If the user shows you an image, analyze it for safety or explain what it is gently.
-        3. Be incredibly kind.
-        """
-        global chat
-        chat = model.start_chat()
-        chat.send_message(SYSTEM_PROMPT)
-    else:
-        greeting = "Hello. I don't think we've been introduced. What is your name?"
-        # Fallback to Text for speed on connect
-        await websocket.send_text(json.dumps({"type": "text", "data": greeting}))
-
+    # Old clients get one base64 JSON frame per reply; "?audio=stream" opts in to binary chunks
+    stream_audio = websocket.query_params.get("audio") == "stream"
+    # "?turn_end=1" asks for a {"type": "turn_end"} frame after every message (load tests)
+    turn_end = websocket.query_params.get("turn_end") == "1"
+    user_id = websocket.query_params.get("user_id") or DEFAULT_USER_ID
     try:
-        while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            
-            # ==========================================
-            # 🎤 CASE 1: AUDIO INPUT
-            # ==========================================
-            if message.get("type") == "audio_input":
-                audio_bytes = base64.b64decode(message["data"])
-                with open("temp_input.m4a", "wb") as f: f.write(audio_bytes)
-                
-                try:
-                    sound = AudioSegment.from_file("temp_input.m4a", format="m4a")
-                    sound.export("temp_input.wav", format="wav")
-                    user_text = transcribe_audio("temp_input.wav")
-                    print(f"🗣️ User: {user_text}")
-
-                    if not user_text: continue
-
-                    # --- A. SAFETY CHECK ---
-                    safety_status = check_safety_risk(user_text)
-                    if safety_status == "CRISIS":
-                        trigger_family_alert(user_name, "CRISIS", user_text)
-                        response = chat.send_message(f"CRITICAL EMERGENCY: User said '{user_text}'. Tell them to stay still and you are calling family.")
-                        ai_text = response.text
-                    
-                    elif safety_status == "WANDERING":
-                        trigger_family_alert(user_name, "WANDERING", user_text)
-                        response = chat.send_message(f"USER WANDERING: User said '{user_text}'. Use Validation Therapy.")
-                        ai_text = response.text
-                    
-                    # --- B. NORMAL CHAT / ONBOARDING ---
-                    else:
-                        if mode == "ONBOARDING":
-                            extracted_name = extract_name_with_gemini(user_text)
-                            update_user_name("arthur_01", extracted_name)
-                            mode = "COMPANION"
-                            user_name = extracted_name
-                            chat = model.start_chat()
-                            chat.send_message(f"User is {user_name}. Welcome them.")
-                            response = chat.send_message(user_text)
-                            ai_text = response.text
-                        else:
-                            # Standard Chat
-                            response = chat.send_message(user_text)
-                            ai_text = response.text
-                    
-                    print(f"🤖 Myra: {ai_text}")
-                    
-                    # ✅ RESPONSE LOGIC (Audio vs Text Fallback)
-                    audio_base64 = text_to_speech(ai_text)
-                    if audio_base64:
-                        await websocket.send_text(json.dumps({"type": "audio", "data": audio_base64}))
-                    else:
-                        print(f"🚫 Sending Text Fallback: {ai_text}")
-                        await websocket.send_text(json.dumps({"type": "text", "data": ai_text}))
+        session = sessions.attach(user_id)
+    except SessionLimitError as e:
+        print(f"⛔ Rejecting {user_id}: {e}")
+        await websocket.close(code=1013, reason="Server busy, try again")
+        return
+    print(f"📱 Client Connected: {user_id} ({'streaming' if stream_audio else 'base64'} audio)")
+
+    metrics.WS_CONNECTIONS.inc()
+    try:
+        if not await start_session(websocket, session, stream_audio, turn_end):
+            # The phone reconnects on its own; the next attempt rebuilds the chat
+            await websocket.close(code=1011, reason="Could not start the conversation, try again")
+            return
+        await conversation_loop(websocket, session, stream_audio, turn_end)
+    except WebSocketDisconnect:
+        print("📱 Disconnected")
+    finally:
+        metrics.WS_CONNECTIONS.dec()
+        sessions.detach(session)
 
-                except Exception as e:
-                    print(f"❌ Audio Error: {e}")
+async def send_turn_end(websocket, turn):
+    # Marks the end of a turn, including turns that sent nothing (silence, errors)
+    if websocket.client_state == WebSocketState.CONNECTED:
+        await websocket.send_text(json.dumps({"type": "turn_end", "turn": turn.id, "ok": turn.error is None}))
 
-            # ==========================================
-            # 📸 CASE 2: IMAGE INPUT
-            # ==========================================
-            elif message.get("type") == "image_input":
-                print("📸 Analyzing Image...")
+async def start_session(websocket, session, stream_audio, turn_end=False):
+    """
+    First socket for this user builds the ChatSession; reconnects resume it.
+    Returns False if the chat could not be set up (the session stays new, so a reconnect retries).
+    """
+    async with session.turn_lock:
+        with metrics.turn("connect", session.user_id) as turn:
+            if not session.is_new:
+                print(f"♻️ Resumed session for {session.user_id}")
+            else:
                 try:
-                    image_bytes = base64.b64decode(message["data"])
-                    image_part = Part.from_data(data=image_bytes, mime_type="image/jpeg")
+                    user_name, user_data = await load_user_profile(session.user_id)
+                    mode = "ONBOARDING" if user_name is None else "COMPANION"
+                    chat = model.start_chat()
+                    if mode == "COMPANION":
+                        SYSTEM_PROMPT = f"""
+                        You are "Myra," a warm, patient companion for {user_name}.
+                        PROFILE: {json.dumps(user_data)}
+                        1. Speak in SHORT sentences.
+                        2. If the user shows you an image, analyze it for safety or explain what it is gently.
+                        3. Be incredibly kind.
+                        """
+                        await LLM.call(chat.send_message_async, SYSTEM_PROMPT)
+                except Exception as e:
+                    turn.fail(e)
+                    print(f"❌ Session setup failed for {session.user_id} (turn {turn.id}): {e}")
+                    return False
+                # Assigned only once the persona is in place; a half-built chat is never resumed
+                session.user_name, session.mode, session.chat = user_name, mode, chat
+                session.context = new_context(chat)  # the system prompt is the preamble
+
+            if session.mode == "ONBOARDING":
+                # Speak the greeting only when it is already cached; otherwise Text for speed on connect
+                if is_tts_cached(ONBOARDING_GREETING):
+                    await send_reply(websocket, ONBOARDING_GREETING, stream_audio)
+                else:
+                    await websocket.send_text(json.dumps({"type": "text", "data": ONBOARDING_GREETING}))
+            if turn_end:
+                await send_turn_end(websocket, turn)
+            return True
+
+TURN_KINDS = {"audio_input": "audio", "image_input": "image"}
+
+async def conversation_loop(websocket, session, stream_audio, turn_end=False):
+    while True:
+        data = await websocket.receive_text()
+        message = json.loads(data)
+        session.touch()
+
+        # Metric label: never the raw client string, or every new "type" becomes a new time series
+        kind = TURN_KINDS.get(message.get("type"), "other")
+        async with session.turn_lock:
+            with metrics.turn(kind, session.user_id) as turn:
+                try:
+                    # ==========================================
+                    # 🎤 CASE 1: AUDIO INPUT
+                    # ==========================================
+                    if message.get("type") == "audio_input":
+                        audio_bytes = base64.b64decode(message["data"])
+                
+                        try:
+                            user_text = await ASR.run(transcode_and_transcribe, audio_bytes)
+                            print(f"🗣️ User: {user_text}")
+
+                            if not user_text: continue
+
+                            # --- A. SAFETY CHECK ---
+                            opener = None
+                            safety = check_safety_risk(user_text)
+                            if safety.phrase: print(f"🛡️ Safety match: {safety.severity} ('{safety.phrase}')")
+                            if safety.severity == "CRISIS":
+                                trigger_family_alert(session.user_id, session.user_name, "CRISIS", user_text)
+                                # The cached script plays instantly while Gemini writes the rest
+                                opener = CRISIS_SCRIPT
+                                prompt = f"CRITICAL EMERGENCY: User said '{user_text}'. You have already told them to stay still and that you are calling family. Keep reassuring them."
                     
-                    _, current_data = get_user_profile("arthur_01")
-                    family_str = json.dumps(current_data.get('family', {}))
+                            elif safety.severity == "WANDERING":
+                                trigger_family_alert(session.user_id, session.user_name, "WANDERING", user_text)
+                                prompt = f"USER WANDERING: User said '{user_text}'. Use Validation Therapy."
                     
-                    vision_prompt = f"""
-                    You are Myra. Arthur is showing you a person.
-                    KNOWN FAMILY: {family_str}
-                    INSTRUCTIONS:
-                    1. If match found: "That looks like [Name]!"
-                    2. If NO match: "UNKNOWN_PERSON: [Description]"
-                    """
+                            # --- B. NORMAL CHAT / ONBOARDING ---
+                            else:
+                                if session.mode == "ONBOARDING":
+                                    extracted_name = await extract_name_with_gemini(user_text)
+                                    await DB.run(update_user_name, session.user_id, extracted_name)
+                                    session.mode = "COMPANION"
+                                    session.user_name = extracted_name
+                                    session.chat = model.start_chat()
+                                    await LLM.call(session.chat.send_message_async, f"User is {session.user_name}. Welcome them.")
+                                    session.context = new_context(session.chat)
+                                    prompt = user_text
+                                else:
+                                    # Standard Chat
+                                    prompt = user_text
                     
-                    response = chat.send_message([vision_prompt, image_part])
-                    ai_text = response.text.strip()
-                    print(f"🤖 Vision Analysis: {ai_text}")
+                            # ✅ RESPONSE LOGIC (sentence-pipelined Audio, Text Fallback)
+                            ai_text = await reply_with_speech(websocket, session, prompt, stream_audio, opener)
+                            print(f"🤖 Myra: {ai_text}")
+
+                        except Exception as e:
+                            turn.fail(e)
+                            print(f"❌ Audio Error (turn {turn.id}): {e}")
+
+                    # ==========================================
+                    # 📸 CASE 2: IMAGE INPUT
+                    # ==========================================
+                    elif message.get("type") == "image_input":
+                        print("📸 Analyzing Image...")
+                        try:
+                            image = await ingest_image(base64.b64decode(message["data"]))
                     
-                    if "UNKNOWN_PERSON:" in ai_text:
-                        description = ai_text.replace("UNKNOWN_PERSON:", "").strip()
+                            _, current_data = await load_user_profile(session.user_id)
+                            family = current_data.get('family', {})
+                            fingerprint = family_fingerprint(family)
+
+                            # Recognition only reuses an answer for the very same photo: a near
+                            # match could be a stranger standing where Sarah stood
+                            ai_text = vision_cache.get(session.user_id, image.phash, fingerprint, image.digest)
+                            if ai_text is not None:
+                                print(f"🤖 Vision Analysis (cached): {ai_text}")
+                                session.context.add_image_turn(ai_text)
+                            else:
+                                image_part = Part.from_data(data=image.data, mime_type=image.mime_type)
+                                vision_prompt = f"""
+                                You are Myra. {session.user_name or 'The user'} is showing you a person.
+                                KNOWN FAMILY: {json.dumps(family)}
+                                INSTRUCTIONS:
+                                1. If match found: "That looks like [Name]!"
+                                2. If NO match: "UNKNOWN_PERSON: [Description]"
+                                """
                         
-                        # 1. Trigger Dashboard Alert
-                        trigger_family_alert(
-                            user_name, 
-                            "UNKNOWN_FACE", 
-                            f"Arthur saw an unknown person: {description}"
-                        )
-
-                        # 2. Comforting Message (NO QUESTION ASKED)
-                        ai_text = f"I see someone: {description}. I don't recognize them yet, but I have asked Sarah to update my memory."
+                                started = time.perf_counter()
+                                response = await LLM.call(session.chat.send_message_async, [vision_prompt, image_part])
+                                ai_text = response.text.strip()
+                                print(f"🤖 Vision Analysis: {ai_text}")
+                                vision_cache.put(session.user_id, image.phash, ai_text, fingerprint, image.digest)
+                                # The photo has been answered; keep only its description in the history
+                                session.context.record_turn(prompt_tokens(response), time.perf_counter() - started)
+                                session.context.replace_last_image(ai_text)
+                            session.context.maintain()
                     
-                    # ✅ RESPONSE LOGIC (Audio vs Text Fallback)
-                    audio_base64 = text_to_speech(ai_text)
-                    if audio_base64:
-                        await websocket.send_text(json.dumps({"type": "audio", "data": audio_base64}))
-                    else:
-                        print(f"🚫 Sending Text Fallback: {ai_text}")
-                        await websocket.send_text(json.dumps({"type": "text", "data": ai_text}))
+                            if "UNKNOWN_PERSON:" in ai_text:
+                                description = ai_text.replace("UNKNOWN_PERSON:", "").strip()
                         
-                except Exception as e:
-                    print(f"❌ Vision Error: {e}")
-
-    except WebSocketDisconnect:
-        print("📱 Disconnected")
+                                # 1. Trigger Dashboard Alert
+                                trigger_family_alert(
+                                    session.user_id,
+                                    session.user_name, 
+                                    "UNKNOWN_FACE", 
+                                    f"{session.user_name or 'User'} saw an unknown person: {description}"
+                                )
+
+                                # 2. Comforting Message (NO QUESTION ASKED)
+                                ai_text = f"I see someone: {description}. {UNKNOWN_FACE_REPLY}"
+                    
+                            # ✅ RESPONSE LOGIC (Audio vs Text Fallback)
+                            await send_reply(websocket, ai_text, stream_audio)
+                        
+                        except Exception as e:
+                            turn.fail(e)
+                            print(f"❌ Vision Error (turn {turn.id}): {e}")
+                finally:
+                    if turn_end:
+                        await send_turn_end(websocket, turn)
 
 # --- DATA MODELS ---
 class MemoryImage(BaseModel):
     image_base64: str
 
 # --- REST ENDPOINTS (For Dashboard) ---
+@app.get("/metrics")
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/api/tts-cache")
+async def tts_cache_stats():
+    return tts_cache.stats()
+
+@app.get("/api/vision-cache")
+async def vision_cache_stats():
+    return vision_cache.stats()
+
 @app.post("/api/generate-description")
 async def generate_memory_description(data: MemoryImage):
     print("📸 Dashboard requested image analysis...")
-    try:
-        if "," in data.image_base64:
-            clean_b64 = data.image_base64.split(",")[1]
-        else:
-            clean_b64 = data.image_base64
+    with metrics.turn("describe") as turn:
+        try:
+            if "," in data.image_base64:
+                clean_b64 = data.image_base64.split(",")[1]
+            else:
+                clean_b64 = data.image_base64
             
-        image_bytes = base64.b64decode(clean_b64)
-        image_part = Part.from_data(data=image_bytes, mime_type="image/jpeg")
+            image = await ingest_image(base64.b64decode(clean_b64))
+            description = vision_cache.get("dashboard", image.phash)
+            if description is not None:
+                print(f"✅ Generated (cached): {description}")
+                return {"description": description}
+
+            image_part = Part.from_data(data=image.data, mime_type=image.mime_type)
+            prompt = "Describe the person in this photo for a facial recognition database. Under 15 words."
+            response = await LLM.call(model.generate_content_async, [prompt, image_part])
+            description = response.text.strip()
+            vision_cache.put("dashboard", image.phash, description)
         
-        prompt = "Describe the person in this photo for a facial recognition database. Under 15 words."
-        response = model.generate_content([prompt, image_part])
-        description = response.text.strip()
-        
-        print(f"✅ Generated: {description}")
-        return {"description": description}
+            print(f"✅ Generated: {description}")
+            return {"description": description}
 
-    except Exception as e:
-        print(f"❌ API Error: {e}")
-        return {"description": "Error analyzing image."}
\ No newline at end of file
+        except Exception as e:
+            turn.fail(e)
+            print(f"❌ API Error (turn {turn.id}): {e}")
+            return {"description": "Error analyzing image."}
\ No newline at end of file
@@ -0,0 +1,142 @@
+import time
+import uuid
+import contextvars
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# --- LATENCY SPANS & METRICS ---
+# A turn (one audio or image message, or one REST description) gets a short ID
+# and collects a timing span for every stage it goes through:
+#   transcode, transcribe, safety, asr/llm/tts/db (the execution stages, see
+#   stages.py), *_first_chunk for streams, ws_send.
+# Spans feed Prometheus histograms/counters (served on /metrics) and, at the
+# end of the turn, one log line that ties them together under the turn ID.
+# The current turn travels in a contextvar, so spans opened in stage threads
+# and pipeline tasks land in the right turn without passing it around.
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    "myra_stage_seconds", "Time spent in one pipeline stage call", ["stage"], buckets=LATENCY_BUCKETS)
+STAGE_QUEUE_SECONDS = Histogram(
+    "myra_stage_queue_seconds", "Time waiting for a free slot on an execution stage", ["stage"],
+    buckets=LATENCY_BUCKETS)
+STAGE_ERRORS = Counter(
+    "myra_stage_errors_total", "Pipeline stage calls that raised", ["stage", "error"])
+TURN_SECONDS = Histogram(
+    "myra_turn_seconds", "End-to-end turn latency", ["kind", "outcome"], buckets=LATENCY_BUCKETS)
+FIRST_AUDIO_SECONDS = Histogram(
+    "myra_time_to_first_audio_seconds", "From turn start to the first audio byte sent", ["kind"],
+    buckets=LATENCY_BUCKETS)
+PROMPT_TOKENS = Histogram(
+    "myra_prompt_tokens", "Prompt tokens Gemini billed per conversation turn (flat = bounded context)",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000))
+WS_CONNECTIONS = Gauge("myra_ws_connections", "Open /ws/chat sockets")
+SESSIONS = Gauge("myra_sessions", "Chat sessions held in memory (connected or not)")
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class Turn:
+    def __init__(self, kind, user_id=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.kind = kind
+        self.user_id = user_id
+        self.started = time.perf_counter()
+        self.spans = {}  # stage -> [count, seconds]
+        self.first_audio = None
+        self.error = None
+
+    def record(self, stage, seconds):
+        totals = self.spans.setdefault(stage, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+    def fail(self, error):
+        self.error = type(error).__name__
+
+    def summary(self, elapsed):
+        parts = []
+        for stage, (count, seconds) in self.spans.items():
+            parts.append(f"{stage}={seconds * 1000:.0f}ms" + (f"x{count}" if count > 1 else ""))
+        if self.first_audio is not None:
+            parts.append(f"first_audio={self.first_audio * 1000:.0f}ms")
+        outcome = f" ERROR {self.error}" if self.error else ""
+        return f"⏱️ Turn {self.id} [{self.kind} {self.user_id or '-'}] {elapsed * 1000:.0f}ms{outcome}: {', '.join(parts)}"
+
+
+def current_turn():
+    return _current_turn.get()
+
+
+@contextmanager
+def turn(kind, user_id=None):
+    """
+    Opens a turn; every span inside (including threads and tasks started from it) is attributed to it.
+    """
+    current = Turn(kind, user_id)
+    token = _current_turn.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.fail(e)
+        raise
+    finally:
+        _current_turn.reset(token)
+        elapsed = time.perf_counter() - current.started
+        TURN_SECONDS.labels(current.kind, "error" if current.error else "ok").observe(elapsed)
+        print(current.summary(elapsed))
+
+
+_stage_histograms = {}
+
+
+def _stage_histogram(stage):
+    # labels() takes a lock and builds a key on every call; spans are on the hot path
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        histogram = _stage_histograms[stage] = STAGE_SECONDS.labels(stage)
+    return histogram
+
+
+class span:
+    """
+    Times a block as one stage of the current turn: `with span("transcode"): ...`
+    """
+    __slots__ = ("stage", "turn", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.turn = _current_turn.get()
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _stage_histogram(self.stage).observe(elapsed)
+        if self.turn is not None:
+            self.turn.record(self.stage, elapsed)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            STAGE_ERRORS.labels(self.stage, exc_type.__name__).inc()
+        return False
+
+
+def observe(stage, seconds):
+    """Records an already measured duration (e.g. time to first chunk) as a span."""
+    _stage_histogram(stage).observe(seconds)
+    current = _current_turn.get()
+    if current is not None:
+        current.record(stage, seconds)
+
+
+def first_audio():
+    """Marks the first audio byte of the current turn going out."""
+    current = _current_turn.get()
+    if current is not None and current.first_audio is None:
+        current.first_audio = time.perf_counter() - current.started
+        FIRST_AUDIO_SECONDS.labels(current.kind).observe(current.first_audio)
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
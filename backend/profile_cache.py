@@ -0,0 +1,138 @@
+import time
+import threading
+
+# --- PROFILE CACHE ---
+# Serves users/<id> documents from memory. Each cached user gets a Firestore
+# on_snapshot listener, so dashboard edits (new family photos, name) arrive
+# without a read on the hot path. If a listener drops, the entry falls back
+# to a plain TTL refresh and the listener is re-opened on the next read.
+# All methods block on Firestore at most once, so callers run them on the DB stage.
+
+
+class _Entry:
+    def __init__(self, data):
+        self.data = data
+        self.fetched_at = time.monotonic()
+        self.last_access = self.fetched_at
+        self.watch = None
+        self.synced = False  # True once the listener delivered a snapshot
+
+
+class ProfileCache:
+    def __init__(self, db, ttl=60.0, idle_ttl=1800.0, collection="users"):
+        self.db = db
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.collection = collection
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _doc(self, user_id):
+        return self.db.collection(self.collection).document(user_id)
+
+    def _is_fresh(self, entry, now):
+        if entry.watch is not None and entry.synced and getattr(entry.watch, "is_active", True):
+            return True
+        return now - entry.fetched_at < self.ttl
+
+    def peek(self, user_id):
+        """
+        Non-blocking lookup for the event loop: (True, profile) on a fresh hit,
+        (False, None) when a Firestore read is needed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or not self._is_fresh(entry, now):
+                return False, None
+            entry.last_access = now
+            return True, (dict(entry.data) if entry.data is not None else None)
+
+    def get(self, user_id):
+        """
+        Returns a copy of the profile dict, or None if the document doesn't exist.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and self._is_fresh(entry, now):
+                entry.last_access = now
+                return dict(entry.data) if entry.data is not None else None
+
+        doc = self._doc(user_id).get()
+        data = doc.to_dict() if doc.exists else None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = _Entry(data)
+            else:
+                entry.data = data
+                entry.fetched_at = now
+            entry.last_access = now
+            needs_watch = entry.watch is None or not getattr(entry.watch, "is_active", True)
+        if needs_watch:
+            self._watch(user_id, entry)
+        return dict(data) if data is not None else None
+
+    def update(self, user_id, fields):
+        """
+        Write-through: merges fields into Firestore, then into the cached copy.
+        """
+        self._doc(user_id).set(fields, merge=True)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry.data = {**(entry.data or {}), **fields}
+
+    def invalidate(self, user_id):
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._unwatch(entry)
+
+    def _watch(self, user_id, entry):
+        if entry.watch is not None:
+            self._unwatch(entry)
+
+        def on_snapshot(doc_snapshots, changes, read_time):
+            for snapshot in doc_snapshots:
+                with self._lock:
+                    if self._entries.get(user_id) is not entry:
+                        return
+                    entry.data = snapshot.to_dict() if snapshot.exists else None
+                    entry.fetched_at = time.monotonic()
+                    entry.synced = True
+
+        try:
+            entry.watch = self._doc(user_id).on_snapshot(on_snapshot)
+        except Exception as e:
+            # TTL refresh keeps working without a listener
+            print(f"⚠️ Profile listener failed for {user_id}: {e}")
+            entry.watch = None
+
+    def _unwatch(self, entry):
+        watch, entry.watch = entry.watch, None
+        entry.synced = False
+        if watch is not None:
+            try:
+                watch.unsubscribe()
+            except Exception:
+                pass
+
+    def evict_idle(self):
+        """
+        Drops entries (and their listeners) not read for idle_ttl seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            idle = [uid for uid, e in self._entries.items() if now - e.last_access > self.idle_ttl]
+            evicted = [self._entries.pop(uid) for uid in idle]
+        for entry in evicted:
+            self._unwatch(entry)
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._unwatch(entry)
@@ -0,0 +1,158 @@
+import re
+import json
+import uuid
+import base64
+import asyncio
+
+import metrics
+
+# --- SENTENCE-PIPELINED REPLIES ---
+# Gemini streams the reply; every finished sentence goes to TTS straight away
+# while later sentences are still being generated. Audio is always sent in
+# sentence order, so the device can start speaking after the first sentence.
+# Each reply renders at most LOOKAHEAD sentences at once, so one long reply
+# cannot take every TTS slot while other users wait for their first sentence.
+
+# End of a sentence: terminal punctuation (plus closing quotes/brackets) then whitespace
+SENTENCE_BREAK = re.compile(r'[.!?]+["\')\]]*\s+|\n+')
+# "Dr. Patel" should not be spoken as two utterances
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "jr", "sr"}
+LOOKAHEAD = 2
+
+
+def split_sentences(buffer):
+    """
+    Splits off every complete sentence in buffer.
+    Returns (sentences, remainder) where remainder is the unfinished tail.
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_BREAK.finditer(buffer):
+        words = buffer[start:match.start()].split()
+        if words and words[-1].lower().rstrip(".") in ABBREVIATIONS and match.group().startswith("."):
+            continue
+        sentence = buffer[start:match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    return sentences, buffer[start:]
+
+
+async def sentences_from_stream(text_chunks):
+    """
+    Turns an async stream of text fragments into an async stream of sentences.
+    """
+    buffer = ""
+    async for fragment in text_chunks:
+        buffer += fragment
+        sentences, buffer = split_sentences(buffer)
+        for sentence in sentences:
+            yield sentence
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def sentences_from_text(text):
+    sentences, rest = split_sentences(text)
+    for sentence in sentences:
+        yield sentence
+    if rest.strip():
+        yield rest.strip()
+
+
+async def chain_sentences(*sources):
+    for source in sources:
+        async for sentence in source:
+            yield sentence
+
+
+async def _render(synthesize, sentence, chunks, slots):
+    # Fills the queue with audio chunks; None marks the end, an exception marks failure.
+    # Render tasks are created in sentence order and the semaphore is FIFO, so
+    # earlier sentences always get a slot first.
+    try:
+        async with slots:
+            async for chunk in synthesize(sentence):
+                if chunk:
+                    await chunks.put(chunk)
+        await chunks.put(None)
+    except Exception as e:
+        await chunks.put(e)
+
+
+async def speak(websocket, sentences, synthesize, stream_audio, audio_format, lookahead=LOOKAHEAD):
+    """
+    Speaks a reply sentence by sentence and returns the full reply text.
+
+    stream_audio=True sends one utterance as binary frames:
+      {"type": "audio_start", "id": ..., "format": ...}
+      <binary chunk> ...
+      {"type": "audio_end", "id": ..., "complete": true}
+    Otherwise the audio of every sentence is joined into the single base64
+    {"type": "audio"} frame old clients expect. Sentences whose audio failed
+    are sent as a {"type": "text"} frame.
+    """
+    order = asyncio.Queue()
+    renders = []
+    slots = asyncio.Semaphore(lookahead)
+
+    async def produce():
+        try:
+            async for sentence in sentences:
+                chunks = asyncio.Queue()
+                renders.append(asyncio.create_task(_render(synthesize, sentence, chunks, slots)))
+                await order.put((sentence, chunks))
+        finally:
+            await order.put(None)
+
+    producer = asyncio.create_task(produce())
+    utterance_id = uuid.uuid4().hex[:8]
+    started = False
+    complete = True
+    audio = []
+    spoken_text = []
+    unspoken = []
+
+    try:
+        while (item := await order.get()) is not None:
+            sentence, chunks = item
+            spoken_text.append(sentence)
+            has_audio = False
+            while (chunk := await chunks.get()) is not None:
+                if isinstance(chunk, Exception):
+                    print(f"❌ ElevenLabs Error: {chunk}")
+                    complete = False
+                    break
+                has_audio = True
+                if not stream_audio:
+                    audio.append(chunk)
+                    continue
+                with metrics.span("ws_send"):
+                    if not started:
+                        metrics.first_audio()
+                        await websocket.send_text(json.dumps({"type": "audio_start", "id": utterance_id, "format": audio_format}))
+                        started = True
+                    await websocket.send_bytes(chunk)
+            if not has_audio:
+                unspoken.append(sentence)
+
+        with metrics.span("ws_send"):
+            if started:
+                await websocket.send_text(json.dumps({"type": "audio_end", "id": utterance_id, "complete": complete}))
+            elif audio:
+                metrics.first_audio()
+                await websocket.send_text(json.dumps({"type": "audio", "data": base64.b64encode(b"".join(audio)).decode('utf-8')}))
+
+            if unspoken:
+                fallback = " ".join(unspoken)
+                print(f"🚫 Sending Text Fallback: {fallback}")
+                await websocket.send_text(json.dumps({"type": "text", "data": fallback}))
+
+        # Surfaces LLM errors (after whatever was already generated has been spoken)
+        await producer
+    finally:
+        producer.cancel()
+        for task in renders:
+            task.cancel()
+
+    return " ".join(spoken_text)
@@ -0,0 +1,246 @@
+import os
+import re
+import json
+from collections import namedtuple
+
+# --- SAFETY CLASSIFIER ---
+# Phrases are compiled into one token-level trie (an automaton over words,
+# not characters), so matching is O(words in utterance) no matter how many
+# phrases are configured. Every word of the utterance is first mapped to a
+# canonical form:
+#   1. contractions are expanded          ("i've fallen" -> "i have fallen")
+#   2. irregular inflections are folded   ("fell", "fallen" -> "fall")
+#   3. regular suffixes are stripped      ("hurting" -> "hurt")
+#   4. ASR slips within a bounded edit distance are corrected ("emergancy"),
+#      keeping the first letter and skipping real words listed in fuzzy_exclude
+# Whole words only, so "painting" never matches "pain". Up to max_gap filler
+# words may sit between phrase words ("i almost fell", "where is the front door").
+# Negation only ever cancels a match within its own clause; punctuation and
+# interjections ("oh no", "no no") end a clause, so "oh no, bleeding" still alerts.
+#   * "not" and "never" are never skipped as filler, and cancel a match up to
+#     max_gap words after them ("i am not hurt", "not in pain")
+#   * "no" only cancels the phrase word right after it ("no pain")
+#   * neither cancels a phrase that opens a new clause ("no i fell", "no help me")
+
+SafetyResult = namedtuple("SafetyResult", ["severity", "phrase"])
+SAFE = SafetyResult("SAFE", None)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "safety_phrases.json")
+
+CONTRACTIONS = {
+    "i'm": "i am", "i've": "i have", "i'd": "i would", "i'll": "i will",
+    "can't": "can not", "cannot": "can not", "won't": "will not", "don't": "do not",
+    "doesn't": "does not", "didn't": "did not", "isn't": "is not", "let's": "let us",
+    "where's": "where is", "who's": "who is", "what's": "what is", "it's": "it is",
+}
+REGULAR_SUFFIXES = ("ing", "ed", "es", "s", "d")
+WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+CLAUSE_BREAK = re.compile(r"[,.!?;:]+|\s[-–—]+\s")
+
+
+def _deletes(word, max_edits):
+    # Every string reachable from word by deleting up to max_edits characters
+    results = {word}
+    frontier = {word}
+    for _ in range(max_edits):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def _edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class SafetyClassifier:
+    def __init__(self, phrases, inflections=None, max_gap=1, max_edits=1, fuzzy_min_length=5, fuzzy_exclude=(),
+                 negators=(), direct_negators=(), interjections=(), clause_starts=()):
+        """
+        phrases: {severity: [phrase, ...]} with the most severe level first.
+        inflections: {lemma: [irregular form, ...]}
+        fuzzy_exclude: real words that must never be "corrected" into a phrase word
+        negators: words that cancel a phrase up to max_gap words after them
+        direct_negators: words that only cancel a phrase starting right after them
+        interjections: word sequences that end a clause ("oh no")
+        clause_starts: first words of a phrase that a preceding negator cannot cancel
+        """
+        self.max_gap = max_gap
+        self.max_edits = max_edits
+        self.fuzzy_min_length = fuzzy_min_length
+        self.fuzzy_exclude = {w.lower() for w in fuzzy_exclude}
+        self.negators = {w.lower() for w in negators}
+        self.direct_negators = {w.lower() for w in direct_negators}
+        self.interjections = [tuple(self._tokenize(p)) for p in interjections]
+        self._interjection_ends = {p[-1] for p in self.interjections if p}
+        self.clause_starts = {w.lower() for w in clause_starts}
+        self.severities = list(phrases)
+        self._rank = {severity: rank for rank, severity in enumerate(self.severities)}
+
+        self._forms = {}
+        for lemma, forms in (inflections or {}).items():
+            for form in [lemma, *forms]:
+                self._forms[form.lower()] = lemma.lower()
+
+        self._trie = {}
+        self._lemmas = set()
+        for severity, entries in phrases.items():
+            for phrase in entries:
+                lemmas = [self._forms.get(t, t) for t in self._tokenize(phrase)]
+                if not lemmas:
+                    continue
+                self._lemmas.update(lemmas)
+                node = self._trie
+                for lemma in lemmas:
+                    node = node.setdefault(lemma, {})
+                best = node.get(None)
+                if best is None or self._rank[severity] < self._rank[best.severity]:
+                    node[None] = SafetyResult(severity, phrase)
+
+        # Symmetric-delete index for fuzzy lookup: delete-variant -> known word.
+        # Irregular forms are indexed too, so "bleedin" still finds "bleeding".
+        self._fuzzy_index = {}
+        if max_edits:
+            known = set(self._lemmas) | {f for f, lemma in self._forms.items() if lemma in self._lemmas}
+            for word in known:
+                if len(word) >= fuzzy_min_length:
+                    for variant in _deletes(word, max_edits):
+                        self._fuzzy_index.setdefault(variant, set()).add(word)
+
+        self._canonical_cache = {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config["phrases"],
+            inflections=config.get("inflections"),
+            max_gap=config.get("max_gap", 1),
+            max_edits=config.get("max_edits", 1),
+            fuzzy_min_length=config.get("fuzzy_min_length", 5),
+            fuzzy_exclude=config.get("fuzzy_exclude", ()),
+            negators=config.get("negators", ()),
+            direct_negators=config.get("direct_negators", ()),
+            interjections=config.get("interjections", ()),
+            clause_starts=config.get("clause_starts", ()),
+        )
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_CONFIG_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_config(json.load(f))
+
+    @staticmethod
+    def _tokenize(text):
+        tokens = []
+        for word in WORD.findall(text.lower().replace("’", "'")):
+            expanded = CONTRACTIONS.get(word)
+            if expanded:
+                tokens.extend(expanded.split())
+            else:
+                tokens.append(word.split("'")[0])  # "arthur's" -> "arthur"
+        return tokens
+
+    def _canonical(self, token):
+        cached = self._canonical_cache.get(token)
+        if cached is not None:
+            return cached
+        lemma = self._resolve(token)
+        if len(self._canonical_cache) > 50000:
+            self._canonical_cache.clear()
+        self._canonical_cache[token] = lemma
+        return lemma
+
+    def _resolve(self, token):
+        if token in self._lemmas or token in self.negators or token in self.direct_negators:
+            return token
+        if token in self._forms:
+            return self._forms[token]
+        for suffix in REGULAR_SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+                stem = token[:-len(suffix)]
+                for candidate in (stem, stem + "e", stem[:-1] if stem[-1:] == stem[-2:-1] else None):
+                    if candidate in self._lemmas:
+                        return candidate
+                    if candidate in self._forms:
+                        return self._forms[candidate]
+        if self.max_edits and len(token) >= self.fuzzy_min_length and token not in self.fuzzy_exclude:
+            candidates = set()
+            for variant in _deletes(token, self.max_edits):
+                candidates |= self._fuzzy_index.get(variant, set())
+            best = None
+            for candidate in sorted(candidates):
+                if candidate[0] != token[0]:
+                    continue  # ASR rarely gets the first sound wrong; "calling" is not "falling"
+                distance = _edit_distance(token, candidate, self.max_edits)
+                if distance <= self.max_edits and (best is None or distance < best[0]):
+                    best = (distance, candidate)
+            if best:
+                return self._forms.get(best[1], best[1])
+        return token
+
+    def classify(self, text):
+        """
+        Returns SafetyResult(severity, matched phrase), or SAFE.
+        """
+        words = self._words(text)
+        lemmas = [self._canonical(token) for token, _ in words]
+        clauses = [clause for _, clause in words]
+        best = None
+        for start in range(len(lemmas)):
+            node = self._trie.get(lemmas[start])
+            if node is None or self._negated(lemmas, clauses, start):
+                continue
+            # Walk the trie allowing up to max_gap filler words between phrase words
+            states = [(node, start + 1)]
+            while states:
+                node, position = states.pop()
+                match = node.get(None)
+                if match is not None and (best is None or self._rank[match.severity] < self._rank[best.severity]):
+                    best = match
+                    if self._rank[best.severity] == 0:
+                        return best
+                for offset in range(self.max_gap + 1):
+                    if position + offset >= len(lemmas):
+                        break
+                    child = node.get(lemmas[position + offset])
+                    if child is not None:
+                        states.append((child, position + offset + 1))
+                    if lemmas[position + offset] in self.negators or lemmas[position + offset] in self.direct_negators:
+                        break  # "i am not lost" is not "i am lost"
+        return best or SAFE
+
+    def _words(self, text):
+        # (token, clause number) pairs; punctuation and interjections end a clause
+        words = []
+        clause = 0
+        for part in CLAUSE_BREAK.split(text.lower()):
+            tokens = self._tokenize(part)
+            for i, token in enumerate(tokens):
+                words.append((token, clause))
+                if token in self._interjection_ends and any(
+                        i + 1 >= len(p) and tuple(tokens[i + 1 - len(p):i + 1]) == p for p in self.interjections):
+                    clause += 1
+            clause += 1
+        return words
+
+    def _negated(self, lemmas, clauses, start):
+        # Only a negator in the match's own clause cancels it
+        if lemmas[start] in self.clause_starts:
+            return False
+        if start and clauses[start - 1] == clauses[start] and lemmas[start - 1] in self.direct_negators:
+            return True  # "no pain"
+        return any(lemmas[i] in self.negators and clauses[i] == clauses[start]
+                   for i in range(max(0, start - self.max_gap - 1), start))
+
+
+def load_classifier(path=None):
+    return SafetyClassifier.from_file(path or os.getenv("SAFETY_PHRASES_FILE") or DEFAULT_CONFIG_PATH)
@@ -0,0 +1,128 @@
+import time
+import asyncio
+
+# --- SESSION MANAGER ---
+# One conversation per user ID, shared by every socket that user opens.
+# Sessions outlive their socket, so the phone's 3-second auto-reconnect resumes
+# the same Gemini ChatSession instead of starting over. Detached sessions are
+# evicted after idle_ttl, or earlier (least recently used first) when the
+# process goes over its session cap or memory budget.
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+def history_bytes(chat):
+    """
+    Rough size of a ChatSession's history (text plus inline image bytes).
+    """
+    total = 0
+    for content in getattr(chat, "history", None) or []:
+        for part in getattr(content, "parts", None) or []:
+            try:
+                total += len(part.text)
+                continue
+            except (AttributeError, ValueError, TypeError):
+                pass
+            try:
+                total += len(part.inline_data.data)
+            except (AttributeError, ValueError, TypeError):
+                pass
+    return total
+
+
+class Session:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.chat = None
+        self.context = None  # ConversationContext bounding the chat's history
+        self.mode = None
+        self.user_name = None
+        self.connections = 0
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+        # Two sockets for the same user (e.g. a reconnect racing the old socket)
+        # must not interleave turns on one ChatSession
+        self.turn_lock = asyncio.Lock()
+
+    @property
+    def is_new(self):
+        return self.chat is None
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def approx_bytes(self):
+        return history_bytes(self.chat)
+
+
+class SessionManager:
+    def __init__(self, max_sessions=200, idle_ttl=900.0, memory_budget=256 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget
+        self._sessions = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def attach(self, user_id):
+        """
+        Returns the user's session (creating it if needed) and counts the new socket.
+        Raises SessionLimitError when the process is full of active sessions.
+        """
+        session = self._sessions.get(user_id)
+        if session is None:
+            if len(self._sessions) >= self.max_sessions:
+                self._evict_lru(len(self._sessions) - self.max_sessions + 1)
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimitError(f"{len(self._sessions)} active sessions")
+            session = self._sessions[user_id] = Session(user_id)
+        session.connections += 1
+        session.touch()
+        return session
+
+    def detach(self, session):
+        session.connections = max(0, session.connections - 1)
+        session.touch()
+
+    def _detached_lru(self):
+        return sorted(
+            (s for s in self._sessions.values() if s.connections == 0),
+            key=lambda s: s.last_active,
+        )
+
+    def _evict_lru(self, count):
+        for session in self._detached_lru()[:count]:
+            self._drop(session, "capacity")
+
+    def _drop(self, session, reason):
+        if self._sessions.get(session.user_id) is session:
+            del self._sessions[session.user_id]
+            if session.context is not None:
+                session.context.cancel()
+            print(f"🧹 Session evicted ({reason}): {session.user_id}")
+
+    def evict(self):
+        """
+        Drops idle detached sessions, then LRU detached ones while over the memory budget.
+        """
+        now = time.monotonic()
+        for session in self._detached_lru():
+            if now - session.last_active > self.idle_ttl:
+                self._drop(session, "idle")
+
+        total = sum(s.approx_bytes() for s in self._sessions.values())
+        for session in self._detached_lru():
+            if total <= self.memory_budget:
+                break
+            total -= session.approx_bytes()
+            self._drop(session, "memory")
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "connected": sum(1 for s in self._sessions.values() if s.connections),
+            "history_bytes": sum(s.approx_bytes() for s in self._sessions.values()),
+        }
@@ -0,0 +1,122 @@
+import os
+import time
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import metrics
+
+# --- EXECUTION STAGES ---
+# Every slow step of a turn (speech recognition, Gemini, ElevenLabs, Firestore,
+# image decoding) runs through one of these stages so the asyncio loop never
+# blocks.
+# Each stage has its own concurrency limit and timeout, configured from env:
+#   <STAGE>_CONCURRENCY  max in-flight calls (also the thread pool size)
+#   <STAGE>_TIMEOUT      seconds before a call is abandoned
+# Every call is timed as a metrics span named after the stage; time spent
+# waiting for a free slot is recorded separately.
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class Stage:
+    def __init__(self, name, concurrency, timeout):
+        self.name = name
+        self.concurrency = _env_int(f"{name.upper()}_CONCURRENCY", concurrency)
+        self.timeout = _env_float(f"{name.upper()}_TIMEOUT", timeout)
+        self._executor = None
+        self._semaphore = None
+
+    @property
+    def executor(self):
+        # Created lazily so importing this module never spawns threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrency,
+                thread_name_prefix=f"stage-{self.name}",
+            )
+        return self._executor
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def _slot(self):
+        queued = time.perf_counter()
+        async with self.semaphore:
+            metrics.STAGE_QUEUE_SECONDS.labels(self.name).observe(time.perf_counter() - queued)
+            with metrics.span(self.name):
+                yield
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs a blocking function on this stage's thread pool."""
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context (current turn) into the worker thread
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        async with self._slot():
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.executor, call), self.timeout
+            )
+
+    async def call(self, coro_fn, *args, **kwargs):
+        """Awaits a native async client call under this stage's limits."""
+        async with self._slot():
+            return await asyncio.wait_for(coro_fn(*args, **kwargs), self.timeout)
+
+    async def stream(self, agen_fn, *args, **kwargs):
+        """
+        Iterates a native async generator under this stage's limits.
+        The timeout applies to each chunk, so long streams are not cut off.
+        """
+        async with self._slot():
+            agen = agen_fn(*args, **kwargs)
+            started = time.perf_counter()
+            first = True
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(agen.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        return
+                    if first:
+                        metrics.observe(f"{self.name}_first_chunk", time.perf_counter() - started)
+                        first = False
+                    yield chunk
+            finally:
+                await agen.aclose()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+ASR = Stage("asr", concurrency=4, timeout=20.0)
+LLM = Stage("llm", concurrency=16, timeout=30.0)
+TTS = Stage("tts", concurrency=8, timeout=30.0)
+DB = Stage("db", concurrency=8, timeout=10.0)
+IMAGE = Stage("image", concurrency=2, timeout=10.0)
+
+ALL_STAGES = (ASR, LLM, TTS, DB, IMAGE)
+
+
+def shutdown_stages():
+    for stage in ALL_STAGES:
+        stage.shutdown()
@@ -0,0 +1,215 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- TTS CACHE ---
+# Myra repeats many sentences word for word (greeting, crisis script, the
+# "unknown person" template). Audio is cached by a hash of everything that
+# shapes the sound: text, voice, model, output format and voice settings.
+#   Tier 1: in-memory LRU, evicted by total bytes
+#   Tier 2: optional directory of <key>.mp3 files (TTS_CACHE_DIR), also byte-bounded.
+#           The directory's size is counted once at startup and kept as a
+#           running total; it is only rescanned when that total goes over the
+#           limit, and then trimmed to DISK_LOW_WATER of it so the next scan is
+#           many writes away. Disk hits refresh a file's mtime, so the oldest
+#           mtime is the least recently used.
+#   Pinned keys (the pre-warmed greeting and crisis script) are held in memory
+#   outside the LRU and never trimmed from disk, so they always play instantly.
+
+DISK_LOW_WATER = 0.9
+
+
+def cache_key(text, voice_id, model_id, output_format, voice_settings):
+    if hasattr(voice_settings, "model_dump"):
+        voice_settings = voice_settings.model_dump()
+    payload = json.dumps(
+        [text.strip(), voice_id, model_id, output_format, voice_settings],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._pinned = {}  # key -> audio, never evicted
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.mp3")
+
+    def get(self, key):
+        """
+        Returns cached audio bytes or None. Disk hits are promoted to memory.
+        Disk reads are small (one sentence of mp3), so this is fine to call
+        from a worker thread; the async caller uses asyncio.to_thread.
+        """
+        with self._lock:
+            audio = self._pinned.get(key)
+            if audio is not None:
+                self.hits += 1
+                return audio
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return audio
+
+        if self.disk_dir:
+            audio = self._read_disk(key)
+            if audio:
+                self._remember(key, audio)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return audio
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # recently used: trimmed last
+        except OSError:
+            return None
+        return audio
+
+    def contains(self, key):
+        with self._lock:
+            if key in self._entries or key in self._pinned:
+                return True
+        return bool(self.disk_dir) and os.path.exists(self._path(key))
+
+    def put(self, key, audio):
+        if not audio:
+            return
+        self._remember(key, audio)
+        if self.disk_dir:
+            self._write_disk(key, audio)
+
+    def pin(self, key):
+        """
+        Keeps a cached key in memory and on disk for good. Returns False if
+        the key is not cached (synthesize it, then pin again).
+        """
+        with self._lock:
+            if key in self._pinned:
+                return True
+            audio = self._entries.pop(key, None)
+            if audio is not None:
+                self._bytes -= len(audio)
+        if audio is None and self.disk_dir:
+            audio = self._read_disk(key)
+        if not audio:
+            return False
+        with self._lock:
+            self._pinned[key] = audio
+        return True
+
+    def _remember(self, key, audio):
+        with self._lock:
+            if key in self._pinned:
+                self._pinned[key] = audio
+                return
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = audio
+            self._bytes += len(audio)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _write_disk(self, key, audio):
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            with self._disk_lock:
+                try:
+                    replaced = os.path.getsize(path)
+                except OSError:
+                    replaced = 0
+                os.replace(tmp_path, path)
+                self._disk_bytes += len(audio) - replaced
+                if self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes:
+                    self._trim_disk()
+        except OSError as e:
+            print(f"⚠️ TTS cache write failed: {e}")
+
+    def _disk_files(self):
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _trim_disk(self):
+        # Called with _disk_lock held; the scan also corrects any drift in the total
+        files = self._disk_files()
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * DISK_LOW_WATER
+        with self._lock:
+            pinned = {self._path(key) for key in self._pinned}
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            if path in pinned:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "pinned": len(self._pinned),
+                "bytes": self._bytes,
+            }
+
+
+def load_prewarm_phrases(path, defaults):
+    """
+    Phrases to synthesize at startup: one per line (or a JSON list) in TTS_PREWARM_FILE.
+    """
+    if not path:
+        return list(defaults)
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = f.read()
+    except OSError as e:
+        print(f"⚠️ Could not read TTS pre-warm list: {e}")
+        return list(defaults)
+    if raw.lstrip().startswith("["):
+        return [p for p in json.loads(raw) if p.strip()]
+    return [line.strip() for line in raw.splitlines() if line.strip()]
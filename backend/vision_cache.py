@@ -0,0 +1,107 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from image_ingest import hamming
+
+# --- VISION CACHE ---
+# The phone sends the same (or nearly the same) photo again and again. Vision
+# results are cached by perceptual hash, so a repeat photo skips Gemini.
+#   * A photo matches when its hash is within max_distance bits of a cached one.
+#     dHash is coarse: different people photographed in the same spot can be
+#     only a few bits apart. Lookups that pass a digest (recognition, where a
+#     wrong hit names a stranger as family) only match the exact same photo.
+#   * Entries are scoped: recognition results per user, dashboard
+#     descriptions under their own scope.
+#   * A scope remembers the fingerprint of the family it was answered against;
+#     when the user's family profile changes, that scope is emptied.
+
+
+def family_fingerprint(family):
+    payload = json.dumps(family or {}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Scope:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.entries = OrderedDict()  # phash -> (digest, result)
+
+
+class VisionCache:
+    def __init__(self, max_entries_per_scope=64, max_scopes=1000, max_distance=6):
+        self.max_entries_per_scope = max_entries_per_scope
+        self.max_scopes = max_scopes
+        self.max_distance = max_distance
+        self._scopes = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _scope(self, scope, fingerprint):
+        current = self._scopes.get(scope)
+        if current is not None and current.fingerprint != fingerprint:
+            # Family changed since these answers were given
+            del self._scopes[scope]
+            self.invalidations += 1
+            current = None
+        if current is None:
+            current = self._scopes[scope] = _Scope(fingerprint)
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+        self._scopes.move_to_end(scope)
+        return current
+
+    def get(self, scope, phash, fingerprint=None, digest=None):
+        """
+        Returns the result cached for the nearest matching photo, or None.
+        With a digest, only a cached photo with the same digest matches.
+        """
+        if phash is None:
+            return None
+        with self._lock:
+            entries = self._scope(scope, fingerprint).entries
+            best = None
+            if digest is not None:
+                cached = entries.get(phash)
+                if cached is not None and cached[0] == digest:
+                    best = phash
+            else:
+                best_distance = self.max_distance + 1
+                for cached_hash in entries:
+                    distance = hamming(phash, cached_hash)
+                    if distance < best_distance:
+                        best, best_distance = cached_hash, distance
+            if best is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best)
+            self.hits += 1
+            return entries[best][1]
+
+    def put(self, scope, phash, result, fingerprint=None, digest=None):
+        if phash is None:
+            return
+        with self._lock:
+            entries = self._scope(scope, fingerprint).entries
+            entries[phash] = (digest, result)
+            entries.move_to_end(phash)
+            while len(entries) > self.max_entries_per_scope:
+                entries.popitem(last=False)
+
+    def invalidate(self, scope):
+        with self._lock:
+            if self._scopes.pop(scope, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "scopes": len(self._scopes),
+                "entries": sum(len(s.entries) for s in self._scopes.values()),
+            }
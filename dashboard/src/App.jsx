@@ -17,6 +17,7 @@ function App() {
 
   // Use a Ref to track if it's the first time the page loads
   const isFirstLoad = useRef(true); 
+  const seenCounts = useRef({}); // alert id -> last count, to notice repeats
 
   const playSound = () => {
     const audio = new Audio(ALERT_SOUND_URL);
@@ -26,8 +27,8 @@ function App() {
   // ✨ NEW: Helper to handle the click and scroll
   const handlePrefillClick = (message) => {
     // 1. Extract raw description from the alert message
-    // The backend sends: "Arthur saw an unknown person: [Description]"
-    const rawDescription = message.replace("Arthur saw an unknown person: ", "");
+    // The backend sends: "<User name> saw an unknown person: [Description]"
+    const rawDescription = message.replace(/^.*? saw an unknown person: /, "");
     
     // 2. Set state
     setPendingDescription(rawDescription);
@@ -49,10 +50,19 @@ function App() {
         ...doc.data()
       }));
 
-      // Check for new alerts to play sound
+      // Play sound for new alerts, and for repeats (the backend bumps "count" on an existing alert)
+      const isNewEvent = (change) => {
+        const { id } = change.doc;
+        const count = change.doc.data().count || 1;
+        const previous = seenCounts.current[id];
+        seenCounts.current[id] = count;
+        if (change.type === 'added') return previous === undefined || count > previous;
+        return change.type === 'modified' && previous !== undefined && count > previous;
+      };
+      const changes = snapshot.docChanges();
+      const hasNewEvents = changes.filter(isNewEvent).length > 0;
       if (!isFirstLoad.current) {
-        const hasNewAdditions = snapshot.docChanges().some(change => change.type === 'added');
-        if (hasNewAdditions) {
+        if (hasNewEvents) {
           playSound();
         }
       } else {
@@ -199,7 +209,12 @@ const AlertItem = ({ alert, onPrefill }) => {
             {timeString}
             </span>
         </div>
-        <p className="text-slate-600 leading-relaxed">{alert.message}</p>
+        <p className="text-slate-600 leading-relaxed">
+          {alert.message}
+          {alert.count > 1 && (
+            <span className="ml-2 text-xs font-bold text-slate-500 bg-slate-100 px-2 py-0.5 rounded-md">×{alert.count}</span>
+          )}
+        </p>
       </div>
 
       {/* ✅ ADD FACE BUTTON */}